@@ -0,0 +1,135 @@
+"""Opens a burst of connections at once and reports accepts per second and time to first message.
+
+The server runs in its own process so the burst is not slowed down by sharing a GIL with it.
+
+Run from the PA2 directory:
+    python -m benchmarks.connection_burst --connections 2000 --backlog 4096
+"""
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+def raise_fd_limit(needed: int):
+    """Raises the open file limit as far as allowed, since every connection needs a descriptor on each side."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def start_server(port: int, backlog: int) -> subprocess.Popen:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(root, "launch_server.py"),
+            "--port", str(port),
+            "--backlog", str(backlog),
+            "--snapshot-dir", "",
+        ],
+        cwd=root,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1.0).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("Server did not start listening")
+
+
+def burst(port: int, connections: int, timeout: float) -> dict:
+    """Starts every connection without waiting, then waits for each one's first message from the server."""
+    selector = selectors.DefaultSelector()
+    started = {}
+    first_message = []
+    failed = 0
+    start = time.perf_counter()
+    for _ in range(connections):
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.setblocking(False)
+        client.connect_ex(("localhost", port))
+        started[client] = time.perf_counter()
+        selector.register(client, selectors.EVENT_READ)
+    deadline = time.monotonic() + timeout
+    while started and time.monotonic() < deadline:
+        for key, _ in selector.select(max(0.0, deadline - time.monotonic())):
+            client = key.fileobj
+            try:
+                data = client.recv(65536)
+            except OSError:
+                data = b""
+            if data:
+                first_message.append(time.perf_counter() - started[client])
+            else:
+                failed += 1
+            selector.unregister(client)
+            del started[client]
+            client.close()
+    elapsed = time.perf_counter() - start
+    failed += len(started)  # Never heard from the server before the timeout
+    for client in started:
+        client.close()
+    selector.close()
+    first_message.sort()
+    count = len(first_message)
+    return {
+        "accepted": count,
+        "failed": failed,
+        "elapsed_s": elapsed,
+        "accepts_per_s": count / elapsed if elapsed else 0.0,
+        "first_message_p50_ms": first_message[count // 2] * 1e3 if count else 0.0,
+        "first_message_p99_ms": first_message[int(count * 0.99)] * 1e3 if count else 0.0,
+        "first_message_max_ms": first_message[-1] * 1e3 if count else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection burst benchmark")
+    parser.add_argument("--connections", type=int, default=1000, help="Connections opened at once per round")
+    parser.add_argument("--rounds", type=int, default=3, help="Bursts to run")
+    parser.add_argument("--backlog", type=int, default=socket.SOMAXCONN, help="Listen backlog passed to the server")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for a burst to be greeted")
+    args = parser.parse_args()
+
+    raise_fd_limit(args.connections * 2 + 64)
+    port = free_port()
+    server = start_server(port, args.backlog)
+    try:
+        print(
+            f"{'round':>5} {'accepted':>9} {'failed':>7} {'accepts/s':>10} "
+            f"{'p50 ttfm (ms)':>14} {'p99 ttfm (ms)':>14} {'max ttfm (ms)':>14}"
+        )
+        for round_number in range(1, args.rounds + 1):
+            result = burst(port, args.connections, args.timeout)
+            print(
+                f"{round_number:>5} {result['accepted']:>9} {result['failed']:>7} {result['accepts_per_s']:>10.0f} "
+                f"{result['first_message_p50_ms']:>14.1f} {result['first_message_p99_ms']:>14.1f} "
+                f"{result['first_message_max_ms']:>14.1f}"
+            )
+            time.sleep(0.5)  # Let the server finish closing the previous burst
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Reports the bytes used per stored message by MessageLog against the old dict-per-message storage.
+
+Run from the PA2 directory:
+    python -m benchmarks.message_log_memory --messages 200000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from message_log import MessageLog
+
+
+class DictMessageLog:
+    """The storage MessageLog used before messages became slotted records, kept for comparison."""
+
+    def __init__(self):
+        self.messages = []
+
+    def add_message(self, message):
+        message["id"] = len(self.messages) + 1
+        message["date"] = time.strftime("%m/%d/%Y")
+        try:
+            message["subject"] = message["subject"].replace("\n", "")
+        except KeyError:
+            message["subject"] = ""
+        self.messages.append(message)
+
+
+def make_frames(count: int, senders: int):
+    """Builds encoded frames the way clients send them, so every decoded name is a fresh string."""
+    rng = random.Random(4065)
+    names = [f"user_{i}" for i in range(senders)]
+    words = ["hello", "group", "meeting", "at", "noon", "see", "you", "there", "thanks", "ok"]
+    return [
+        json.dumps(
+            {
+                "name": rng.choice(names),
+                "message": " ".join(rng.choice(words) for _ in range(rng.randint(3, 12))),
+                "subject": rng.choice(["", "", "update", "question"]),
+            }
+        ).encode("utf-8")
+        for _ in range(count)
+    ]
+
+
+def measure(log_factory, frames) -> float:
+    """Returns the bytes retained per message after storing every frame in a fresh log."""
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    log = log_factory()
+    for frame in frames:
+        log.add_message(json.loads(frame))
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del log
+    return (retained - start) / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MessageLog memory benchmark")
+    parser.add_argument("--messages", type=int, default=200000, help="Messages to store")
+    parser.add_argument("--senders", type=int, default=50, help="Distinct sender names")
+    args = parser.parse_args()
+
+    frames = make_frames(args.messages, args.senders)
+    before = measure(DictMessageLog, frames)
+    after = measure(lambda: MessageLog("default"), frames)
+    print(f"messages stored:       {args.messages}")
+    print(f"dict messages:         {before:.1f} bytes/message")
+    print(f"slotted records:       {after:.1f} bytes/message")
+    print(f"saved:                 {before - after:.1f} bytes/message ({(1 - after / before) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Compares round trip latency and producer throughput over a Unix domain socket and loopback TCP.
+
+Run from the PA2 directory:
+    python -m benchmarks.unix_vs_tcp --round-trips 2000 --messages 20000
+"""
+import argparse
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from protocol import FrameBuffer
+from server import Server
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+def frame(name: str, message: str) -> bytes:
+    return json.dumps({"name": name, "message": message, "subject": ""}).encode("utf-8")
+
+
+class BenchClient:
+    """A minimal client that speaks the server's protocol without prompting for input."""
+
+    def __init__(self, connect, name: str):
+        self.socket = connect()
+        self.name = name
+        self.frames = FrameBuffer()
+        self.pending = []
+        self.socket.sendall(frame(name, "has connected."))
+
+    def send(self, message: str):
+        self.socket.sendall(frame(self.name, message))
+
+    def wait_for(self, predicate) -> dict:
+        """Reads until a message matching predicate arrives and returns it."""
+        while True:
+            while self.pending:
+                message = self.pending.pop(0)
+                if predicate(message):
+                    return message
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            self.pending = self.frames.feed(data)
+
+    def close(self):
+        self.send("!disconnect")
+        self.socket.close()
+
+
+def run(label: str, connect, round_trips: int, messages: int) -> dict:
+    producer = BenchClient(connect, f"{label}_producer")
+    producer.send("!get_groups")  # The reply means the producer has joined, so it will see the consumer join
+    producer.wait_for(lambda m: m.get("message", "").startswith("Groups:"))
+    consumer = BenchClient(connect, f"{label}_consumer")
+    producer.wait_for(lambda m: m.get("message", "") == f"{consumer.name} has joined the chat.")
+
+    latencies = []
+    for _ in range(round_trips):
+        sent_at = time.perf_counter()
+        producer.send("!get_groups")
+        producer.wait_for(lambda m: m.get("message", "").startswith("Groups:"))
+        latencies.append(time.perf_counter() - sent_at)
+    latencies.sort()
+
+    marker = f"{label} bench"
+    received = []
+
+    def consume():
+        for _ in range(messages):
+            consumer.wait_for(lambda m: m.get("message", "").startswith(marker))
+        received.append(time.perf_counter())
+
+    consumer_thread = threading.Thread(target=consume)
+    consumer_thread.start()
+    start = time.perf_counter()
+    for index in range(messages):
+        producer.send(f"{marker} {index}")
+    consumer_thread.join()
+    elapsed = received[0] - start
+
+    producer.close()
+    consumer.close()
+    return {
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "messages_per_s": messages / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unix domain socket vs loopback TCP benchmark")
+    parser.add_argument("--round-trips", type=int, default=2000, help="Request/reply round trips per transport")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages sent by the producer per transport")
+    args = parser.parse_args()
+
+    port = free_port()
+    unix_path = os.path.join(tempfile.mkdtemp(), "server.sock")
+    server = Server(port=port, unix_path=unix_path)
+    server_thread = threading.Thread(target=server.start)
+    server_thread.daemon = True
+    server_thread.start()
+    time.sleep(0.5)
+
+    def tcp():
+        client = socket.create_connection(("localhost", port))
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return client
+
+    def unix():
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(unix_path)
+        return client
+
+    results = {
+        "tcp": run("tcp", tcp, args.round_trips, args.messages),
+        "unix": run("unix", unix, args.round_trips, args.messages),
+    }
+    print(f"{'':>6} {'p50 rtt (us)':>14} {'p99 rtt (us)':>14} {'messages/s':>12}")
+    for label, result in results.items():
+        print(
+            f"{label:>6} {result['p50_us']:14.1f} {result['p99_us']:14.1f} {result['messages_per_s']:12.0f}"
+        )
+    tcp_result, unix_result = results["tcp"], results["unix"]
+    print(
+        f"unix vs tcp: {(1 - unix_result['p50_us'] / tcp_result['p50_us']) * 100:+.1f}% lower p50 latency, "
+        f"{(unix_result['messages_per_s'] / tcp_result['messages_per_s'] - 1) * 100:+.1f}% throughput"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from capture.runtime import *
\ No newline at end of file
@@ -0,0 +1,233 @@
+import socket
+import struct
+import threading
+import time
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Tuple
+
+MAGIC = b"PA2CAP1\n"
+OPEN = 0  # A client connected
+DATA = 1  # Bytes received from a client
+CLOSE = 2  # A client's connection ended
+
+_HEADER = struct.Struct("<BIdI")  # Kind, connection id, seconds since capture start, payload length
+
+
+class CaptureRecord(NamedTuple):
+    kind: int
+    connection_id: int
+    timestamp: float
+    payload: bytes
+
+
+class TrafficRecorder:
+    """
+    This class will record everything clients send to the server so it can be replayed later.
+
+    Records are written as a fixed size binary header followed by the raw payload, with timestamps taken from a
+    monotonic clock relative to when the recorder was created.
+    """
+
+    def __init__(self, path: str):
+        """
+        This function will open the capture file, replacing any existing capture at the path.
+        """
+        self.path = path
+        self._file: BinaryIO = open(path, "wb")
+        self._file.write(MAGIC)
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, kind: int, connection_id: int, payload: bytes = b""):
+        """
+        This function will append a record to the capture.
+
+        Args:
+            kind (int): OPEN, DATA or CLOSE.
+            connection_id (int): The id the server gave the connection.
+            payload (bytes): The bytes received, for DATA records.
+        """
+        header = _HEADER.pack(
+            kind, connection_id, time.monotonic() - self._start, len(payload)
+        )
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(header)
+            self._file.write(payload)
+            self._file.flush()  # A crash should lose as little of the traffic leading up to it as possible
+
+    def close(self):
+        """
+        This function will flush and close the capture file.
+        """
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """
+    This function will yield every record in a capture file in the order it was written.
+    A record cut short by the server stopping mid-write ends the capture.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+        while True:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            kind, connection_id, timestamp, length = _HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            yield CaptureRecord(kind, connection_id, timestamp, payload)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """
+    This function will return the value at a fraction of the way through the sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class CaptureReplayer:
+    """
+    This class will drive a server with the traffic from a capture, opening one connection per captured connection.
+
+    Latency is measured for every frame that gets a reply: the time from sending the frame until the first bytes
+    arrive on the same connection, before the next frame is sent on it. Replays at speed 0 send the next frame
+    before the reply to the last one can arrive, so they only report throughput.
+    """
+
+    def __init__(
+        self, records: List[CaptureRecord], addr: Tuple[str, int], speed: float = 1.0
+    ):
+        """
+        This function will initialize the replayer.
+
+        Args:
+            records (List[CaptureRecord]): The capture to replay.
+            addr (Tuple[str, int]): The address of the server.
+            speed (float): How many times faster than captured to replay. 0 replays as fast as possible.
+        """
+        self.records = records
+        self.addr = addr
+        self.speed = speed
+        self._sockets: Dict[int, socket.socket] = {}
+        self._readers: List[threading.Thread] = []
+        self._sent: Dict[int, List[float]] = {}
+        self._received: Dict[int, List[Tuple[float, int]]] = {}
+
+    def _read(self, connection_id: int, client: socket.socket):
+        """
+        Thread that records when replies arrive on a connection until the server closes it.
+        """
+        arrivals = self._received[connection_id]
+        while True:
+            try:
+                data = client.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            arrivals.append((time.monotonic(), len(data)))
+        client.close()
+
+    def _open(self, connection_id: int):
+        client = socket.create_connection(self.addr)
+        self._sockets[connection_id] = client
+        self._sent[connection_id] = []
+        self._received[connection_id] = []
+        reader = threading.Thread(target=self._read, args=(connection_id, client))
+        reader.daemon = True
+        reader.start()
+        self._readers.append(reader)
+
+    def _close(self, connection_id: int):
+        client = self._sockets.pop(connection_id, None)
+        if client is not None:
+            try:
+                client.shutdown(socket.SHUT_WR)  # The reader closes it once the server hangs up
+            except OSError:
+                pass
+
+    def run(self, timeout: float = 10.0) -> Dict[str, float]:
+        """
+        This function will replay the capture and return a report of the results.
+
+        Args:
+            timeout (float): Seconds to wait for the server to finish replying once everything has been sent.
+
+        Returns:
+            Dict[str, float]: Throughput and latency figures for the replay.
+        """
+        frames = 0
+        sent_bytes = 0
+        first = self.records[0].timestamp if self.records else 0.0
+        start = time.monotonic()
+        for record in self.records:
+            if self.speed > 0:
+                delay = start + (record.timestamp - first) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if record.kind == OPEN:
+                self._open(record.connection_id)
+            elif record.kind == DATA and record.connection_id in self._sockets:
+                self._sent[record.connection_id].append(time.monotonic())
+                self._sockets[record.connection_id].sendall(record.payload)
+                frames += 1
+                sent_bytes += len(record.payload)
+            elif record.kind == CLOSE:
+                self._close(record.connection_id)
+        sending_done = time.monotonic()
+
+        for connection_id in list(self._sockets):
+            self._close(connection_id)
+        deadline = time.monotonic() + timeout
+        for reader in self._readers:
+            reader.join(max(0.0, deadline - time.monotonic()))
+
+        return self._report(frames, sent_bytes, start, sending_done)
+
+    def _report(
+        self, frames: int, sent_bytes: int, start: float, sending_done: float
+    ) -> Dict[str, float]:
+        latencies = []
+        received_bytes = 0
+        last_arrival = sending_done
+        for connection_id, sends in self._sent.items():
+            arrivals = self._received[connection_id]
+            received_bytes += sum(size for _, size in arrivals)
+            if arrivals:
+                last_arrival = max(last_arrival, arrivals[-1][0])
+            position = 0
+            for index, sent_at in enumerate(sends):
+                next_send = sends[index + 1] if index + 1 < len(sends) else float("inf")
+                while position < len(arrivals) and arrivals[position][0] < sent_at:
+                    position += 1
+                if position < len(arrivals) and arrivals[position][0] <= next_send:
+                    latencies.append(arrivals[position][0] - sent_at)
+        latencies.sort()
+        duration = max(last_arrival - start, 1e-9)
+        report = {
+            "connections": len(self._sent),
+            "frames": frames,
+            "sent_bytes": sent_bytes,
+            "received_bytes": received_bytes,
+            "duration_s": duration,
+            "frames_per_s": frames / duration,
+            "received_bytes_per_s": received_bytes / duration,
+        }
+        if self.speed <= 0:
+            return report  # Replies cannot be told apart from the frames sent back to back
+        report.update({
+            "latency_samples": len(latencies),
+            "latency_mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "latency_p50_ms": _percentile(latencies, 0.50) * 1000,
+            "latency_p95_ms": _percentile(latencies, 0.95) * 1000,
+            "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+            "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        })
+        return report
@@ -3,21 +3,27 @@ import threading
 import logging
 import json
 import re
+from protocol import FrameBuffer
 from typing import List, Dict, Tuple
 
 logging.basicConfig(level=logging.INFO)
 
 
 class Client:
-    def __init__(self, host, port):
-        self.addr = (host, port)
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def __init__(self, host, port, unix_path=None):
+        if unix_path:  # Connect over a Unix domain socket when on the same host as the server
+            self.addr = unix_path
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.addr = (host, port)
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._logger = logging.getLogger(__name__)
         self._format = "utf-8"
         self.lock = threading.Lock()
         self.connected = False
         self.name = input("Enter name: ")
         self.current_group: str = "default"
+        self._frames = FrameBuffer(self._format)  # Replies may arrive split or several per read
 
     def send(self, msg: str) -> bool:
         """This method sends a message to the server.
@@ -28,6 +34,8 @@ class Client:
         Returns:
             bool: True if the message was sent successfully, False otherwise.
         """
+        if msg.lower().startswith("!batch "):
+            return self.send_batch(msg[len("!batch ") :].split(";"))
         try:
             subject = ""
             message = msg.strip()
@@ -47,6 +55,27 @@ class Client:
             self._logger.error(f"Error sending message: {e}")
             return False
 
+    def send_batch(self, commands: List[str]) -> bool:
+        """This method sends several commands to the server in one frame. The server replies with one frame holding
+        the results of every command, in order.
+
+        Args:
+            commands (List[str]): The commands to send.
+
+        Returns:
+            bool: True if the batch was sent successfully, False otherwise.
+        """
+        try:
+            batch = [command.strip() for command in commands if command.strip()]
+            response_data = {"name": self.name, "message": "", "subject": "", "batch": batch}
+            response_string = json.dumps(response_data)
+            with self.lock:
+                self.socket.sendall(response_string.encode(encoding=self._format))
+            return True
+        except Exception as e:
+            self._logger.error(f"Error sending batch: {e}")
+            return False
+
     def recv(self) -> List[Dict[str, str]]:
         """This method receives a message from the server. It will return a list of dictionaries containing the parsed JSON objects.
 
@@ -54,8 +83,13 @@ class Client:
             List[Dict[str, str]]: A list of dictionaries containing the parsed JSON objects. Name and message are the keys.
         """
         try:
-            json_message_string = self.socket.recv(1024).decode(self._format)
-            messages = self.parse_json_string(json_message_string)
+            messages = []
+            for message in self._frames.feed(self.socket.recv(1024)):
+                if "batch" in message:  # Unpack the results of a batch in command order
+                    for result in message["batch"]:
+                        messages.extend(result["results"])
+                else:
+                    messages.append(message)
             return messages
         except Exception as e:
             self._logger.error(f"Error receiving message: {e}")
@@ -73,7 +107,9 @@ class Client:
                     for message in received_msgs:
                         if message["message"]:
                             print("\r                            ", end="")
-                            if "group" in message:
+                            if "to" in message:  # Confirmation of a direct message this client sent
+                                group_str = f"[{message['group']} to {message['to']}]"
+                            elif "group" in message:
                                 group_str = f"[{message['group']}]"
                             else:
                                 group_str = ""
@@ -115,38 +151,6 @@ class Client:
                 if self.connected:
                     self._logger.error(f"Error receiving message: {e}")
 
-    def parse_json_string(self, json_string: str) -> List[Dict[str, str]]:
-        """This method parses a JSON string into a list of dictionaries.
-
-        Args:
-            json_string (str): The JSON string to parse.
-
-        Returns:
-            List[Dict[str, str]]: A list of dictionaries containing the parsed JSON objects. Name and message are the keys.
-        """
-        parsed_list = []
-
-        if not json_string:
-            return parsed_list
-
-        json_objects = json_string.split("}{")
-
-        for i, object in enumerate(json_objects):
-            if object[0] != "{":
-                object = "{" + object
-            if object[-1] != "}":
-                object = object + "}"
-            json_objects[i] = object
-
-        for obj in json_objects:
-            try:
-                parsed_dict = json.loads(obj)
-                parsed_list.append(parsed_dict)
-            except json.JSONDecodeError:
-                self._logger.error(f"Skipping invalid JSON object: {obj}")
-
-        return parsed_list
-
     def start(self):
         """
         This function starts the client. It will connect to the server and start a
@@ -158,7 +162,7 @@ class Client:
                 try:
                     self.socket.connect(self.addr)
                     break  # Break out of the loop if connection is successful
-                except ConnectionRefusedError:
+                except (ConnectionRefusedError, FileNotFoundError):
                     print("[ERROR] Connection refused.")
                     try:
                         host = input("Enter new host: ")
@@ -187,7 +191,10 @@ class Client:
                 msg = "has connected."
                 self.send(msg)
 
-            print(f"[CONNECTED] Connected to server on {self.addr[0]}:{self.addr[1]}")
+            if isinstance(self.addr, str):
+                print(f"[CONNECTED] Connected to server on {self.addr}")
+            else:
+                print(f"[CONNECTED] Connected to server on {self.addr[0]}:{self.addr[1]}")
 
             receive_thread = threading.Thread(target=self.receive_messages)
             receive_thread.daemon = True
@@ -1,6 +1,9 @@
 from message_log import *
+from snapshot import SnapshotStore
 import socket
-from typing import Tuple, Dict
+import threading
+import time
+from typing import Tuple, Dict, List, Optional, Any
 
 class Group:
     def __init__(self, n: str, og_n:str):
@@ -9,8 +12,10 @@ class Group:
         """
         self.name = n
         self.original_name = og_n
-        self._log = MessageLog()
+        self._log = MessageLog(n)
         self._num_members = 0
+        self.last_active = time.monotonic()
+        self.dirty = True
         
     def new_message(self, message: Dict[str, str]) -> bool:
         """
@@ -18,6 +23,8 @@ class Group:
         """
         try:
             self._log.add_message(message)
+            self.last_active = time.monotonic()
+            self.dirty = True
             return True
         except Exception:
             return False
@@ -55,6 +62,7 @@ class Group:
         try:
             self._new_member(user, socket_info)
             self._num_members += 1
+            self.last_active = time.monotonic()
             return True
         except Exception:
             return False
@@ -66,6 +74,7 @@ class Group:
         try:
             if self._remove_member(user):
                 self._num_members -= 1
+                self.last_active = time.monotonic()
                 return True
             return False
         except Exception:
@@ -101,8 +110,260 @@ class Group:
         """
         return self._log.get_message_by_id(id)
     
+    def get_num_messages(self) -> int:
+        """
+        This function will return the number of messages still held in the group's log.
+        """
+        return len(self._log.messages)
+
+    def get_log_bytes(self) -> int:
+        """
+        This function will return the approximate number of bytes held by the group's log.
+        """
+        return self._log.total_bytes
+
+    def get_memory_usage(self) -> Dict[str, int]:
+        """
+        This function will return the approximate bytes held by the group's stored messages and by its member map.
+        """
+        return {"messages": self._log.total_bytes, "members": self._log.get_users_bytes()}
+
+    def compact(self, policy: RetentionPolicy) -> Tuple[int, int]:
+        """
+        This function will drop messages outside the retention policy from the group's log.
+        Message ids do not change, and dropped ids are reported as expired.
+
+        Returns:
+            Tuple[int, int]: The number of messages removed and the approximate bytes reclaimed.
+        """
+        evicted, reclaimed = self._log.compact(policy)
+        if evicted:
+            self.dirty = True
+        return evicted, reclaimed
+
+    def page_out(self, store: SnapshotStore, keep: int) -> Tuple[int, int]:
+        """
+        This function will move all but the newest keep messages of the group's log to the store.
+        They are read back from the store when requested by id, and retention still applies to them.
+
+        Returns:
+            Tuple[int, int]: The number of messages paged out and the approximate bytes reclaimed.
+        """
+        self._log.pager = store
+        paged, reclaimed = self._log.page_out(keep)
+        if paged:
+            self.dirty = True  # The log's list of pages changed
+        return paged, reclaimed
+
     def get_original_name(self) -> str:
         """
         This function will return the original name of the group.
         """
-        return self.original_name
\ No newline at end of file
+        return self.original_name
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        This function will return the group's name and message log in a form that can be written to disk.
+        """
+        return {
+            "name": self.name,
+            "original_name": self.original_name,
+            "log": self._log.snapshot(),
+        }
+
+    @classmethod
+    def from_snapshot(cls, state: Dict[str, Any], store: Optional[SnapshotStore] = None) -> "Group":
+        """
+        This function will rebuild a group from the output of snapshot(). Paged out messages are read from store.
+        """
+        group = cls(state["name"], state["original_name"])
+        group._log = MessageLog.from_snapshot(state["log"], group.name, store)
+        group.dirty = False
+        return group
+
+
+class GroupRegistry:
+    """
+    This class will hold the server's groups. Groups are only loaded from the snapshot store when they are
+    first accessed, and groups with no members and no recent traffic are written back out and dropped.
+    """
+
+    def __init__(
+        self,
+        store: Optional[SnapshotStore] = None,
+        defaults: Optional[Dict[str, str]] = None,
+        idle_timeout: float = 300.0,
+    ):
+        """
+        This function will initialize the registry. Nothing is read from the store until a group is accessed.
+
+        Args:
+            store (SnapshotStore): Where groups are persisted. Groups are kept in memory forever if None.
+            defaults (Dict[str, str]): {Group name: original name} of groups that always exist.
+            idle_timeout (float): Seconds without traffic before an empty group may be paged out.
+        """
+        self._store = store
+        self._defaults = dict(defaults or {})
+        self._resident: Dict[str, Group] = {}
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()  # Keeps snapshot passes in order without holding up lookups
+        self.idle_timeout = idle_timeout
+
+    def _materialize(self, group_name: str) -> Optional[Group]:
+        """
+        This function will return a group, loading it from the store or creating a default group if needed.
+        """
+        with self._lock:
+            group = self._resident.get(group_name)
+            if group is not None:
+                return group
+        # Read without the lock so lookups of other groups are not held up by the disk
+        state = self._store.load(group_name) if self._store else None
+        if state is not None:
+            group = Group.from_snapshot(state, self._store)
+        elif group_name in self._defaults:
+            group = Group(group_name, self._defaults[group_name])
+        else:
+            return None
+        with self._lock:
+            # Another thread may have loaded the group in the meantime, and only one copy may be used
+            return self._resident.setdefault(group_name, group)
+
+    def __getitem__(self, group_name: str) -> Group:
+        group = self._materialize(group_name)
+        if group is None:
+            raise KeyError(group_name)
+        return group
+
+    def __setitem__(self, group_name: str, group: Group):
+        with self._lock:
+            self._resident[group_name] = group
+
+    def __contains__(self, group_name: str) -> bool:
+        with self._lock:
+            if group_name in self._resident or group_name in self._defaults:
+                return True
+        return self._store is not None and self._store.exists(group_name)
+
+    def get(self, group_name: str, default: Optional[Group] = None) -> Optional[Group]:
+        """
+        This function will return a group, or default if it does not exist.
+        """
+        group = self._materialize(group_name)
+        return default if group is None else group
+
+    def _all_names(self) -> Dict[str, str]:
+        """
+        This function will return {group name: original name} for every known group, resident or not.
+        """
+        names = dict(self._defaults)
+        if self._store is not None:
+            names.update(self._store.load_index())
+        with self._lock:
+            names.update(
+                {name: group.get_original_name() for name, group in self._resident.items()}
+            )
+        return names
+
+    @property
+    def persistent(self) -> bool:
+        """
+        This function will return whether or not groups are written to a snapshot store.
+        """
+        return self._store is not None
+
+    def keys(self) -> List[str]:
+        """
+        This function will return the names of every known group.
+        """
+        return list(self._all_names().keys())
+
+    def original_names(self) -> List[str]:
+        """
+        This function will return the original names of every known group.
+        """
+        return list(self._all_names().values())
+
+    def resident(self) -> List[Group]:
+        """
+        This function will return the groups currently held in memory. Groups on disk never have members.
+        """
+        with self._lock:
+            return list(self._resident.values())
+
+    def snapshot(self) -> int:
+        """
+        This function will write every group that changed since the last snapshot to the store.
+
+        Returns:
+            int: The number of groups written.
+        """
+        if self._store is None:
+            return 0
+        with self._write_lock:
+            with self._lock:  # Only copy the state here; encoding and writing happen without the lock
+                states = []
+                for name, group in self._resident.items():
+                    if not group.dirty:
+                        continue
+                    group.dirty = False  # Cleared first so a message added mid-write marks it again
+                    states.append((name, group.snapshot()))
+                names = {name: group.get_original_name() for name, group in self._resident.items()}
+            for name, state in states:
+                self._store.save(name, state)
+            self._store.save_index(names)
+        return len(states)
+
+    def page_history(self, keep: int) -> Tuple[int, int]:
+        """
+        This function will move all but the newest keep messages of every resident group to the store.
+
+        Returns:
+            Tuple[int, int]: The number of messages paged out and the approximate bytes reclaimed.
+        """
+        if self._store is None:
+            return 0, 0
+        paged = reclaimed = 0
+        for group in self.resident():
+            count, freed = group.page_out(self._store, keep)
+            paged += count
+            reclaimed += freed
+        return paged, reclaimed
+
+    def page_out(self, idle_timeout: Optional[float] = None) -> int:
+        """
+        This function will drop empty groups that have been idle for longer than idle_timeout, writing them first if needed.
+        Callers must make sure no other thread is holding on to a group while this runs.
+
+        Args:
+            idle_timeout (float): Overrides the registry's idle_timeout for this call, 0 to drop every empty group.
+
+        Returns:
+            int: The number of groups paged out.
+        """
+        if self._store is None:
+            return 0
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        now = time.monotonic()
+        paged = 0
+        with self._write_lock:
+            with self._lock:
+                idle = []
+                for name, group in self._resident.items():
+                    if group.get_all_users() or now - group.last_active < idle_timeout:
+                        continue
+                    state = group.snapshot() if group.dirty else None
+                    group.dirty = False
+                    idle.append((name, group, state))
+            for name, group, state in idle:
+                if state is not None:
+                    self._store.save(name, state)
+                    self._store.save_index({name: group.get_original_name()})
+            with self._lock:
+                for name, group, _ in idle:
+                    # Groups that were used while being written stay resident and are written again later
+                    if self._resident.get(name) is group and not group.dirty and not group.get_all_users():
+                        del self._resident[name]
+                        paged += 1
+        return paged
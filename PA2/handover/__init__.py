@@ -0,0 +1 @@
+from handover.runtime import *
\ No newline at end of file
@@ -0,0 +1,66 @@
+import json
+import socket
+import struct
+from typing import Any, Dict, List, Tuple
+
+_HEADER = struct.Struct("!II")  # State length, number of file descriptors
+_MAX_FDS = 250  # Stay under the kernel's limit on descriptors per SCM_RIGHTS message
+ACK = b"OK"
+
+
+def fd_passing_supported() -> bool:
+    """
+    This function will return whether or not this platform can pass sockets between processes.
+    """
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def _recv_exact(conn: socket.socket, size: int) -> bytes:
+    """
+    This function will read exactly size bytes from a connection.
+    """
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Handover connection closed early")
+        data += chunk
+    return data
+
+
+def send_state(conn: socket.socket, state: Dict[str, Any], fds: List[int]):
+    """
+    This function will send server state and a list of file descriptors to another process over a Unix socket.
+    The descriptors are passed with SCM_RIGHTS, so the receiving process gets its own copies of them.
+
+    Args:
+        conn (socket.socket): A connected Unix stream socket.
+        state (Dict[str, Any]): JSON serializable state to send along with the descriptors.
+        fds (List[int]): The file descriptors to pass, in order.
+    """
+    payload = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    conn.sendall(_HEADER.pack(len(payload), len(fds)))
+    conn.sendall(payload)
+    for start in range(0, len(fds), _MAX_FDS):
+        socket.send_fds(conn, [b"F"], fds[start : start + _MAX_FDS])
+
+
+def receive_state(conn: socket.socket) -> Tuple[Dict[str, Any], List[int]]:
+    """
+    This function will receive the state and file descriptors sent by send_state().
+
+    Returns:
+        Tuple[Dict[str, Any], List[int]]: The state and the received file descriptors, in the order they were sent.
+    """
+    length, count = _HEADER.unpack(_recv_exact(conn, _HEADER.size))
+    state = json.loads(_recv_exact(conn, length).decode("utf-8"))
+    fds: List[int] = []
+    while len(fds) < count:
+        # Every batch carries exactly one byte, so each read returns one batch of descriptors
+        data, received, flags, _ = socket.recv_fds(conn, 1, _MAX_FDS)
+        if not data:
+            raise ConnectionError("Handover connection closed before all sockets arrived")
+        if flags & getattr(socket, "MSG_CTRUNC", 0):
+            raise OSError("Sockets were dropped during the handover")
+        fds.extend(received)
+    return state, fds
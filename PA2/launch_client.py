@@ -5,9 +5,10 @@ def main():
     parser = argparse.ArgumentParser(description="Client for connecting to a message board server")
     parser.add_argument("--ip", type=str, default="localhost", help="Server IP address")
     parser.add_argument("--port", type=int, default=8080, help="Server port number")
+    parser.add_argument("--unix", type=str, default=None, help="Connect through this Unix domain socket path instead of TCP")
     args = parser.parse_args()
 
-    client = Client(host=args.ip, port=args.port)
+    client = Client(host=args.ip, port=args.port, unix_path=args.unix)
     client.start()
 
 if __name__ == "__main__":
@@ -1,12 +1,96 @@
 from server import *
+from pipeline import MessagePipeline, PipelineStage, BUILTIN_STAGES
+from message_log import RetentionPolicy
+from memory import MemoryLimits
 import argparse
+import multiprocessing
+import socket
 
 def main():
     parser = argparse.ArgumentParser(description="Server for hosting a message board")
-    parser.parse_args()
+    parser.add_argument("--ip", type=str, default="localhost", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--backlog", type=int, default=socket.SOMAXCONN, help="Connections the kernel queues before they are accepted")
+    parser.add_argument("--recv-buffer", type=int, default=None, help="SO_RCVBUF size for client sockets, in bytes (system default if unset)")
+    parser.add_argument("--send-buffer", type=int, default=None, help="SO_SNDBUF size for client sockets, in bytes (system default if unset)")
+    parser.add_argument("--handshake-timeout", type=float, default=None, help="Seconds a new connection may take to send its name before it is closed (no limit if unset)")
+    parser.add_argument("--snapshot-dir", type=str, default="snapshots", help="Directory groups are snapshotted to (empty string to disable)")
+    parser.add_argument("--snapshot-interval", type=float, default=30.0, help="Seconds between snapshots")
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="Seconds an empty group may sit idle before it is paged out")
+    parser.add_argument("--capture", type=str, default=None, help="Record all client traffic to this file for replay_capture.py")
+    parser.add_argument("--unix", type=str, default=None, help="Also listen on this Unix domain socket path")
+    parser.add_argument("--unix-allow-uid", type=int, action="append", default=None, help="Only accept Unix socket peers running as this uid (repeatable)")
+    parser.add_argument("--pipeline", type=str, default="", help=f"Comma separated message processing stages to run, in order ({', '.join(BUILTIN_STAGES)})")
+    parser.add_argument("--pipeline-workers", type=int, default=None, help="Worker processes for the pipeline (defaults to the CPU count)")
+    parser.add_argument("--stage-timeout", type=float, default=1.0, help="Seconds a pipeline stage may take before the message skips it")
+    parser.add_argument("--handover", type=str, default=None, help="Unix socket path for zero downtime restarts: a server started with the same path takes over this one's clients")
+    parser.add_argument("--retain-messages", type=int, default=None, help="Most messages each group keeps (oldest are dropped first)")
+    parser.add_argument("--retain-age", type=float, default=None, help="Seconds a message is kept before it is dropped")
+    parser.add_argument("--retain-bytes", type=int, default=None, help="Approximate bytes of messages each group keeps")
+    parser.add_argument("--group-retention", type=str, action="append", default=[], help="Per group limits as 'name=messages,age,bytes', empty fields unlimited (repeatable)")
+    parser.add_argument("--compaction-interval", type=float, default=60.0, help="Seconds between passes that enforce the retention limits")
+    parser.add_argument("--memory-trim-mb", type=float, default=None, help="Approximate memory use at which history held in memory is trimmed")
+    parser.add_argument("--memory-refuse-mb", type=float, default=None, help="Approximate memory use at which !join stops creating new groups")
+    parser.add_argument("--memory-disconnect-mb", type=float, default=None, help="Approximate memory use at which the slowest consumers are disconnected")
+    parser.add_argument("--trim-messages", type=int, default=100, help="Messages each group keeps in memory when history is trimmed")
+    parser.add_argument("--trim-drops-history", action="store_true", help="Let trimming delete history that cannot be paged out to the snapshot directory")
+    parser.add_argument("--slow-consumer-kb", type=float, default=64.0, help="Unsent output a client must have before it may be disconnected")
+    parser.add_argument("--memory-interval", type=float, default=5.0, help="Seconds between memory use checks")
+    args = parser.parse_args()
 
-    server = Server()
+    pipeline = None
+    if args.pipeline:
+        for name in args.pipeline.split(","):
+            if name not in BUILTIN_STAGES:
+                parser.error(f"unknown pipeline stage: {name}")
+        stages = [
+            PipelineStage(name, BUILTIN_STAGES[name], timeout=args.stage_timeout)
+            for name in args.pipeline.split(",")
+        ]
+        pipeline = MessagePipeline(stages, workers=args.pipeline_workers)
+
+    retention = RetentionPolicy(args.retain_messages, args.retain_age, args.retain_bytes)
+    group_retention = {}
+    for entry in args.group_retention:
+        name, _, limits = entry.partition("=")
+        try:
+            group_retention[name.strip().replace(" ", "_")] = RetentionPolicy.parse(limits)
+        except ValueError as e:
+            parser.error(f"invalid --group-retention {entry!r}: {e}")
+
+    to_bytes = lambda megabytes: None if megabytes is None else int(megabytes * 1024 * 1024)
+    memory_limits = MemoryLimits(
+        trim_at=to_bytes(args.memory_trim_mb),
+        refuse_groups_at=to_bytes(args.memory_refuse_mb),
+        disconnect_at=to_bytes(args.memory_disconnect_mb),
+        trim_messages=args.trim_messages,
+        drop_history=args.trim_drops_history,
+        slow_consumer_bytes=int(args.slow_consumer_kb * 1024),
+    )
+
+    server = Server(
+        host=args.ip,
+        port=args.port,
+        snapshot_dir=args.snapshot_dir or None,
+        snapshot_interval=args.snapshot_interval,
+        idle_timeout=args.idle_timeout,
+        capture_path=args.capture,
+        unix_path=args.unix,
+        allowed_uids=args.unix_allow_uid,
+        pipeline=pipeline,
+        handover_path=args.handover,
+        retention=None if retention.is_unlimited() else retention,
+        group_retention=group_retention,
+        compaction_interval=args.compaction_interval,
+        backlog=args.backlog,
+        recv_buffer=args.recv_buffer,
+        send_buffer=args.send_buffer,
+        handshake_timeout=args.handshake_timeout,
+        memory_limits=None if memory_limits.is_unlimited() else memory_limits,
+        memory_interval=args.memory_interval,
+    )
     server.start()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Needed for the pipeline's worker processes in the PyInstaller build
     main()
\ No newline at end of file
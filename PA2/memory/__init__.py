@@ -0,0 +1 @@
+from memory.runtime import *
\ No newline at end of file
@@ -0,0 +1,115 @@
+import socket
+import struct
+from typing import Optional
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows
+    fcntl = termios = None
+
+_TIOCOUTQ = getattr(termios, "TIOCOUTQ", None)  # Same request as SIOCOUTQ on Linux sockets
+
+# Load shedding levels, each including the steps of the ones below it
+NORMAL = 0
+TRIM = 1  # Page history held in memory out to disk, or delete it if allowed
+REFUSE_GROUPS = 2  # Refuse to create new groups from !join
+DISCONNECT = 3  # Disconnect the slow consumers with the most unsent output
+LEVEL_NAMES = {
+    NORMAL: "normal",
+    TRIM: "trim",
+    REFUSE_GROUPS: "refuse_groups",
+    DISCONNECT: "disconnect",
+}
+
+
+def pending_output_supported() -> bool:
+    """
+    This function will return whether or not this platform can report how much output a socket has not yet sent.
+    """
+    return _TIOCOUTQ is not None
+
+
+def pending_output(sock: socket.socket) -> int:
+    """
+    This function will return the bytes written to a socket that the peer has not yet received.
+    These sit in the kernel's send buffer, so a client that stops reading grows this until the buffer is full.
+
+    Returns:
+        int: The bytes waiting to be sent, or 0 if the socket is closed or the platform cannot tell.
+    """
+    if _TIOCOUTQ is None:
+        return 0
+    try:
+        result = fcntl.ioctl(sock.fileno(), _TIOCOUTQ, b"\0\0\0\0")
+    except (OSError, ValueError):  # ValueError once the socket has been closed
+        return 0
+    return struct.unpack("i", result)[0]
+
+
+class MemoryLimits:
+    """
+    This class will hold the high-water marks, in approximate bytes, at which the server starts shedding load.
+    Each mark should be higher than the one before it, and marks left as None are never reached.
+    """
+
+    __slots__ = (
+        "trim_at",
+        "refuse_groups_at",
+        "disconnect_at",
+        "trim_messages",
+        "slow_consumer_bytes",
+        "drop_history",
+    )
+
+    def __init__(
+        self,
+        trim_at: Optional[int] = None,
+        refuse_groups_at: Optional[int] = None,
+        disconnect_at: Optional[int] = None,
+        trim_messages: int = 100,
+        slow_consumer_bytes: int = 64 * 1024,
+        drop_history: bool = False,
+    ):
+        """
+        This function will initialize the limits.
+
+        Args:
+            trim_at (int): Bytes in use at which history is trimmed.
+            refuse_groups_at (int): Bytes in use at which !join stops creating new groups.
+            disconnect_at (int): Bytes in use at which slow consumers are disconnected.
+            trim_messages (int): Messages each log keeps in memory when history is trimmed.
+            slow_consumer_bytes (int): Unsent output a connection must have before it may be disconnected.
+            drop_history (bool): Whether trimming may delete history that cannot be paged out to a snapshot store.
+        """
+        self.trim_at = trim_at
+        self.refuse_groups_at = refuse_groups_at
+        self.disconnect_at = disconnect_at
+        self.trim_messages = trim_messages
+        self.slow_consumer_bytes = slow_consumer_bytes
+        self.drop_history = drop_history
+
+    def is_unlimited(self) -> bool:
+        """
+        This function will return True if none of the marks are set.
+        """
+        return self.trim_at is None and self.refuse_groups_at is None and self.disconnect_at is None
+
+    def level(self, used: int) -> int:
+        """
+        This function will return the highest load shedding level whose mark has been reached.
+
+        Args:
+            used (int): The approximate bytes in use.
+
+        Returns:
+            int: NORMAL, TRIM, REFUSE_GROUPS or DISCONNECT.
+        """
+        for level, mark in (
+            (DISCONNECT, self.disconnect_at),
+            (REFUSE_GROUPS, self.refuse_groups_at),
+            (TRIM, self.trim_at),
+        ):
+            if mark is not None and used >= mark:
+                return level
+        return NORMAL
@@ -1,18 +1,125 @@
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Any, Optional
 import socket
+import sys
+import threading
 import time
 
 
+def format_date(timestamp: int) -> str:
+    """
+    This function will format an epoch timestamp the way dates are sent to clients.
+    """
+    return time.strftime("%m/%d/%Y", time.localtime(timestamp))
+
+
+class MessageRecord:
+    """
+    This class will hold a single stored message. Sender and group names are interned and the date is kept as
+    integer epoch seconds, so it is only formatted when the message is sent to a client.
+    """
+
+    __slots__ = ("id", "name", "message", "subject", "group", "timestamp")
+
+    def __init__(
+        self, id: int, name: str, message: str, subject: str, group: str, timestamp: int
+    ):
+        self.id = id
+        self.name = sys.intern(name)
+        self.message = message
+        self.subject = subject
+        self.group = sys.intern(group)
+        self.timestamp = timestamp
+
+    def to_dict(self) -> Dict[str, str]:
+        """
+        This function will return the message in the form it is sent to clients.
+        """
+        return {
+            "name": self.name,
+            "message": self.message,
+            "subject": self.subject,
+            "id": self.id,
+            "date": format_date(self.timestamp),
+            "group": self.group,
+        }
+
+    def size(self) -> int:
+        """
+        This function will return the approximate number of bytes the record holds on to. Sender and group names are
+        interned and shared between records, so they are not counted.
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.message) + sys.getsizeof(self.subject)
+
+
+class RetentionPolicy:
+    """
+    This class will describe how much history a message log keeps. Limits left as None are not enforced.
+    """
+
+    __slots__ = ("max_messages", "max_age", "max_bytes")
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        This function will initialize the policy.
+
+        Args:
+            max_messages (int): The most messages to keep.
+            max_age (float): The oldest a message may be, in seconds.
+            max_bytes (int): The most approximate bytes of messages to keep.
+        """
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def is_unlimited(self) -> bool:
+        """
+        This function will return True if the policy does not limit anything.
+        """
+        return self.max_messages is None and self.max_age is None and self.max_bytes is None
+
+    @classmethod
+    def parse(cls, text: str) -> "RetentionPolicy":
+        """
+        This function will build a policy from "max_messages,max_age,max_bytes". Empty fields are left unlimited.
+        """
+        fields = [field.strip() for field in text.split(",")]
+        if len(fields) > 3:
+            raise ValueError(f"Expected at most three limits, got {text!r}")
+        max_messages, max_age, max_bytes = fields + [""] * (3 - len(fields))
+        return cls(
+            int(max_messages) if max_messages else None,
+            float(max_age) if max_age else None,
+            int(max_bytes) if max_bytes else None,
+        )
+
+    def __repr__(self) -> str:
+        return f"RetentionPolicy(max_messages={self.max_messages}, max_age={self.max_age}, max_bytes={self.max_bytes})"
+
+
 class MessageLog:
     """
     This class will handle storing all of the server's information.
     """
 
-    def __init__(self):
+    def __init__(self, group: str = ""):
         """
         This function will initialize the MessageLog class.
         """
-        self.messages: List[Dict[str, str]] = []
+        self.group = group
+        self.messages: List[MessageRecord] = []
+        self.first_id = 1  # Oldest id still kept; it moves forward as old messages are compacted away
+        self.resident_id = 1  # Id of messages[0]; kept messages older than it have been paged out
+        self.total_bytes = 0
+        # [first id, count, approximate bytes, newest timestamp] of each page of messages written out, oldest first
+        self.pages: List[List[int]] = []
+        self.pager = None  # Where pages are written and read back, such as a SnapshotStore
+        self._lock = threading.Lock()  # Only held for appends and for cutting compacted messages off the front
+        self._compact_lock = threading.Lock()  # One compaction at a time, so the front of the log is stable while it runs
         self.users: Dict[str, Tuple[socket.socket, str]] = {}
         self.blank_message = {
             "name": "",
@@ -30,13 +137,21 @@ class MessageLog:
         Args:
             message (Dict[str, str]): The message to add to the log.
         """
-        message["id"] = len(self.messages) + 1
-        message["date"] = time.strftime("%m/%d/%Y")
-        try:
-            message["subject"] = message["subject"].replace("\n", "")
-        except KeyError:
-            message["subject"] = ""
-        self.messages.append(message)
+        with self._lock:
+            record = MessageRecord(
+                self.resident_id + len(self.messages),
+                message["name"],
+                message["message"],
+                message.get("subject", "").replace("\n", ""),
+                self.group,
+                int(time.time()),
+            )
+            self.messages.append(record)
+            self.total_bytes += record.size()
+        # The caller sends the message straight out, so give it the wire fields
+        message["id"] = record.id
+        message["date"] = format_date(record.timestamp)
+        message["subject"] = record.subject
 
     def add_user(self, user, socket_info: Tuple[socket.socket, str]):
         """
@@ -54,7 +169,7 @@ class MessageLog:
         """
         This function will return all messages in the log in reverse order. (Newest first)
         """
-        return list(reversed(self.messages))
+        return [record.to_dict() for record in reversed(self.messages)]
 
     def get_all_users(self):
         """
@@ -62,6 +177,16 @@ class MessageLog:
         """
         return self.users
 
+    def get_users_bytes(self) -> int:
+        """
+        This function will return the approximate number of bytes held by the map of users. Sockets are shared with
+        the rest of the server, so only the map, the names and the entries are counted.
+        """
+        users = list(self.users.items())
+        return sys.getsizeof(self.users) + sum(
+            sys.getsizeof(user) + sys.getsizeof(socket_info) for user, socket_info in users
+        )
+
     def is_user_in_log(self, user: str) -> bool:
         """
         This function will return True if the user is in the log.
@@ -70,18 +195,137 @@ class MessageLog:
 
     def get_message_by_id(self, id: int) -> Dict[str, str]:
         """
-        This function will return a message by its id.
+        This function will return a message by its id, reading it back from its page if it was paged out.
+        """
+        with self._lock:
+            index = id - self.resident_id  # Ids are assigned in order, so the id gives the position directly
+            if 0 <= index < len(self.messages):
+                return self.messages[index].to_dict()
+            if 1 <= id < self.first_id:
+                return self.expired_message(id)
+            page = next((page for page in self.pages if page[0] <= id < page[0] + page[1]), None)
+        if page is None or self.pager is None:
+            return self.blank_message
+        state = self.pager.load_page(self.group, page[0])
+        if state is None:
+            return self.expired_message(id)  # Compacted away since the page was found
+        name, message, subject, timestamp = state["messages"][id - page[0]]
+        return MessageRecord(id, name, message, subject, self.group, timestamp).to_dict()
+
+    def expired_message(self, id: int) -> Dict[str, str]:
+        """
+        This function will return the message sent in place of one that was removed by the retention policy.
+        """
+        return {
+            "name": "Server",
+            "message": f"Message {id} has expired and is no longer available.",
+            "id": id,
+            "date": "",
+            "subject": "",
+            "group": self.group,
+            "expired": True,
+        }
+
+    def compact(self, policy: RetentionPolicy, now: Optional[float] = None) -> Tuple[int, int]:
         """
-        for message in self.messages:
-            if message["id"] == id:
-                return message
-        return self.blank_message
+        This function will remove the oldest messages that fall outside the retention policy, counting the messages
+        that were paged out. Paged out messages are only read back as whole pages, so max_age and max_bytes drop a
+        page once all of it is outside the policy. Compactions of the same log run one at a time, and the messages to
+        drop are picked without holding the lock, so only the final cut briefly blocks add_message.
+
+        Args:
+            policy (RetentionPolicy): The limits to enforce.
+            now (float): The current epoch time, used for max_age. Defaults to time.time().
+
+        Returns:
+            Tuple[int, int]: The number of messages removed and the approximate bytes of memory reclaimed.
+        """
+        with self._compact_lock:
+            with self._lock:
+                messages = self.messages
+                count = len(messages)  # Messages appended while this runs are newer, so they are never cut
+                total_bytes = self.total_bytes
+                first_id = self.first_id
+                pages = list(self.pages)
+            paged = self.resident_id - first_id  # Only changed by page_out, which takes the same compaction lock
+            page_ends = [page[0] + page[1] - first_id for page in pages]  # The cut that drops each page
+            cut = 0
+            if policy.max_messages is not None:
+                cut = max(cut, paged + count - policy.max_messages)
+            if policy.max_age is not None:
+                oldest = (time.time() if now is None else now) - policy.max_age
+                for page, end in zip(pages, page_ends):
+                    if page[3] >= oldest:
+                        break
+                    cut = max(cut, end)
+                if cut >= paged:
+                    while cut - paged < count and messages[cut - paged].timestamp < oldest:
+                        cut += 1
+            reclaimed = sum(record.size() for record in messages[: max(cut - paged, 0)])
+            if policy.max_bytes is not None:
+                kept = total_bytes - reclaimed
+                kept += sum(page[2] for page, end in zip(pages, page_ends) if end > cut)
+                for page, end in zip(pages, page_ends):
+                    if kept <= policy.max_bytes:
+                        break
+                    if end > cut:
+                        kept -= page[2]
+                        cut = end
+                while cut - paged < count and kept > policy.max_bytes:
+                    size = messages[cut - paged].size()
+                    kept -= size
+                    reclaimed += size
+                    cut += 1
+            if cut == 0:
+                return 0, 0
+            with self._lock:
+                if cut > paged:
+                    del self.messages[: cut - paged]
+                    self.resident_id += cut - paged
+                    self.total_bytes -= reclaimed
+                self.first_id += cut
+                dropped = [page for page in self.pages if page[0] + page[1] <= self.first_id]
+                self.pages = self.pages[len(dropped) :]
+            for page in dropped:
+                self.pager.delete_page(self.group, page[0])
+            return cut, reclaimed
+
+    def page_out(self, keep: int) -> Tuple[int, int]:
+        """
+        This function will write all but the newest keep messages to a page through the pager and drop them from
+        memory. They can still be read with get_message_by_id until the retention policy removes them.
+
+        Args:
+            keep (int): The number of newest messages to keep in memory.
+
+        Returns:
+            Tuple[int, int]: The number of messages paged out and the approximate bytes of memory reclaimed.
+        """
+        with self._compact_lock:
+            with self._lock:
+                records = self.messages[: max(len(self.messages) - keep, 0)]
+            if not records:
+                return 0, 0
+            state = {
+                "messages": [
+                    [record.name, record.message, record.subject, record.timestamp]
+                    for record in records
+                ]
+            }
+            self.pager.save_page(self.group, records[0].id, state)  # Written before anything is dropped
+            reclaimed = sum(record.size() for record in records)
+            with self._lock:
+                del self.messages[: len(records)]
+                self.resident_id += len(records)
+                self.total_bytes -= reclaimed
+                self.pages.append([records[0].id, len(records), reclaimed, records[-1].timestamp])
+            return len(records), reclaimed
 
     def get_last_two_messages(self) -> List[Dict[str, str]]:
         """
         This function will return the last two messages in the log.
         """
-        all_messages = self.get_all_messages()
+        all_messages = [record.to_dict() for record in self.messages[-1:-3:-1]]
         try:
             return [all_messages[1], all_messages[0]]
         except IndexError:
@@ -89,3 +333,35 @@ class MessageLog:
                 return [self.blank_message, all_messages[0]]
             except IndexError:
                 return [self.blank_message, self.blank_message]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        This function will return the log's messages in a compact form for writing to disk.
+        Users are left out since their sockets do not outlive the process.
+        """
+        with self._lock:
+            first_id, pages, messages = self.first_id, [list(page) for page in self.pages], list(self.messages)
+        return {
+            "first_id": first_id,
+            "pages": pages,
+            "messages": [
+                [record.name, record.message, record.subject, record.timestamp]
+                for record in messages
+            ],
+        }
+
+    @classmethod
+    def from_snapshot(cls, state: Dict[str, Any], group: str = "", pager=None) -> "MessageLog":
+        """
+        This function will rebuild a log from the output of snapshot(). Pages are read back through pager.
+        """
+        log = cls(group)
+        log.pager = pager
+        log.first_id = state["first_id"]
+        log.pages = state["pages"]
+        log.resident_id = log.pages[-1][0] + log.pages[-1][1] if log.pages else log.first_id
+        for index, (name, message, subject, timestamp) in enumerate(state["messages"]):
+            record = MessageRecord(log.resident_id + index, name, message, subject, group, timestamp)
+            log.messages.append(record)
+            log.total_bytes += record.size()
+        return log
@@ -0,0 +1 @@
+from pipeline.runtime import *
\ No newline at end of file
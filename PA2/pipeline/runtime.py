@@ -0,0 +1,261 @@
+import collections
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+Message = Dict[str, str]
+
+PROFANITY = {"damn", "hell", "crap"}
+_PROFANITY_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(PROFANITY)) + r")\b", re.IGNORECASE
+)
+_LINK_PATTERN = re.compile(r"https?://[^\s'\"<>]+")
+
+
+def filter_profanity(message: Message) -> Message:
+    """
+    This function will mask words from PROFANITY in a message's subject and body.
+    """
+    mask = lambda match: "*" * len(match.group(0))
+    message["message"] = _PROFANITY_PATTERN.sub(mask, message["message"])
+    if message.get("subject"):
+        message["subject"] = _PROFANITY_PATTERN.sub(mask, message["subject"])
+    return message
+
+
+def extract_links(message: Message) -> Message:
+    """
+    This function will add the links found in a message's body to its "links" field.
+    """
+    links = _LINK_PATTERN.findall(message["message"])
+    if links:
+        message["links"] = links
+    return message
+
+
+BUILTIN_STAGES: Dict[str, Callable[[Message], Optional[Message]]] = {
+    "profanity": filter_profanity,
+    "links": extract_links,
+}
+
+
+class PipelineStage:
+    """
+    This class will describe one step of the message pipeline.
+
+    The function runs in a worker process, so it must be defined at the top level of a module. It returns the
+    processed message, or None to drop it. If it raises, runs past its timeout or its worker process dies, the
+    fallback is run in the server's process instead; by default the message passes through unchanged.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Message], Optional[Message]],
+        timeout: float = 1.0,
+        fallback: Optional[Callable[[Message], Optional[Message]]] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.fallback = fallback or (lambda message: message)
+
+
+class MessagePipeline:
+    """
+    This class will run group messages through an ordered list of stages before they are stored and sent out.
+
+    Stage functions run in a process pool so CPU heavy work does not hold the GIL or the server's lock. Each group
+    is always handled by the same dispatcher thread, which keeps the messages of a group in the order they were sent.
+    Processed messages are handed to a delivery thread for their group, so a slow client only holds up its own groups.
+    """
+
+    def __init__(
+        self,
+        stages: List[PipelineStage],
+        workers: Optional[int] = None,
+        dispatchers: int = 4,
+    ):
+        """
+        This function will initialize the pipeline and start its dispatcher threads.
+
+        Args:
+            stages (List[PipelineStage]): The stages to run, in order.
+            workers (int): Number of worker processes. Defaults to the number of CPUs.
+            dispatchers (int): Number of threads feeding the worker processes.
+        """
+        self.stages = stages
+        self._logger = logging.getLogger(__name__)
+        self._workers = workers
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            stage.name: {
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "timeouts": 0,
+                "errors": 0,
+                "dropped": 0,
+            }
+            for stage in stages
+        }
+        self._queues: List[queue.Queue] = [queue.Queue() for _ in range(dispatchers)]
+        # Processed messages waiting to be delivered, by key; a key only has an entry while its thread is running
+        self._deliveries: Dict[str, collections.deque] = {}
+        self._deliveries_idle = threading.Condition()
+        self._threads = []
+        for work in self._queues:
+            thread = threading.Thread(target=self._dispatch, args=(work,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key: str, message: Message, callback: Callable[[Message], None]):
+        """
+        This function will queue a message. Once every stage has run, callback is called with the processed message
+        from a delivery thread. Messages submitted with the same key are processed and delivered in order.
+
+        Args:
+            key (str): The ordering key, usually the group name.
+            message (Message): The message to process.
+            callback (Callable[[Message], None]): Called with the processed message unless a stage drops it.
+        """
+        self._queues[hash(key) % len(self._queues)].put((key, message, callback))
+
+    def _dispatch(self, work: queue.Queue):
+        """
+        Thread that runs queued messages through the stages one at a time.
+        """
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            key, message, callback = item
+            try:
+                processed = self.process(message)
+                if processed is not None:
+                    self._queue_delivery(key, callback, processed)
+            except Exception as e:
+                self._logger.error(f"Error processing message: {e}")
+            finally:
+                work.task_done()
+
+    def _queue_delivery(self, key: str, callback: Callable[[Message], None], message: Message):
+        """
+        This function will queue a processed message for delivery, starting a delivery thread for its key if needed.
+        Callbacks usually send to sockets, so they never run on a dispatcher thread.
+        """
+        with self._deliveries_idle:
+            backlog = self._deliveries.get(key)
+            if backlog is not None:
+                backlog.append((callback, message))
+                return
+            self._deliveries[key] = collections.deque([(callback, message)])
+        thread = threading.Thread(target=self._deliver, args=(key,))
+        thread.daemon = True
+        thread.start()
+
+    def _deliver(self, key: str):
+        """
+        Thread that calls the callbacks queued for one key in order, and exits once there are none left.
+        """
+        while True:
+            with self._deliveries_idle:
+                backlog = self._deliveries[key]
+                if not backlog:
+                    del self._deliveries[key]
+                    self._deliveries_idle.notify_all()
+                    return
+                callback, message = backlog.popleft()
+            try:
+                callback(message)
+            except Exception as e:
+                self._logger.error(f"Error delivering processed message: {e}")
+
+    def process(self, message: Message) -> Optional[Message]:
+        """
+        This function will run a message through every stage and return the result, or None if it was dropped.
+        """
+        for stage in self.stages:
+            start = time.perf_counter()
+            outcome = None
+            pool = self._pool
+            try:
+                future = pool.submit(stage.func, message)
+                result = future.result(timeout=stage.timeout)
+            except TimeoutError:
+                future.cancel()  # A task that already started keeps its worker until it finishes
+                outcome = "timeouts"
+                result = stage.fallback(message)
+            except BrokenProcessPool as e:
+                self._logger.error(f"Pipeline stage {stage.name} lost its worker process: {e}")
+                self._replace_pool(pool)
+                outcome = "errors"
+                result = stage.fallback(message)
+            except Exception as e:
+                self._logger.error(f"Pipeline stage {stage.name} failed: {e}")
+                outcome = "errors"
+                result = stage.fallback(message)
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._stats_lock:
+                stats = self._stats[stage.name]
+                stats["count"] += 1
+                stats["total_ms"] += elapsed
+                stats["max_ms"] = max(stats["max_ms"], elapsed)
+                if outcome:
+                    stats[outcome] += 1
+                if result is None:
+                    stats["dropped"] += 1
+            if result is None:
+                return None
+            message = result
+        return message
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """
+        This function will start a new process pool in place of one that lost a worker process, which fails every
+        task submitted to it afterwards. Dispatchers that saw the same pool break only replace it once.
+        """
+        with self._pool_lock:
+            if self._pool is not broken:
+                return
+            self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        broken.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        This function will return the timing counters of each stage, including the mean time per message.
+        """
+        with self._stats_lock:
+            report = {name: dict(stats) for name, stats in self._stats.items()}
+        for stats in report.values():
+            stats["mean_ms"] = stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+        return report
+
+    def drain(self):
+        """
+        This function will block until every message queued so far has been processed and delivered.
+        """
+        for work in self._queues:
+            work.join()
+        with self._deliveries_idle:
+            self._deliveries_idle.wait_for(lambda: not self._deliveries)
+
+    def shutdown(self):
+        """
+        This function will finish processing the queued messages and stop the worker processes.
+        """
+        for work in self._queues:
+            work.put(None)
+        for thread in self._threads:
+            thread.join()
+        with self._deliveries_idle:
+            self._deliveries_idle.wait_for(lambda: not self._deliveries)
+        self._pool.shutdown()
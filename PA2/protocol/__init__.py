@@ -0,0 +1 @@
+from protocol.runtime import *
\ No newline at end of file
@@ -0,0 +1,159 @@
+import codecs
+import json
+import re
+from typing import Dict, List
+
+_STRUCTURE = re.compile(r'[{}"]')  # Characters that matter outside a string
+_STRING_END = re.compile(r'["\\]')  # Characters that matter inside a string
+
+
+class FrameBuffer:
+    """
+    This class will turn a stream of received bytes into JSON messages. Messages that arrive together are split
+    apart and messages cut off at the end of a read are held until the rest arrives.
+    """
+
+    MAX_PENDING = 1 << 20  # Give up on a message that never completes
+    _MIN_CHECK = 4096  # Partial messages are only checked for invalid JSON once they reach this size, then each doubling
+
+    def __init__(self, encoding: str = "utf-8"):
+        """
+        This function will initialize an empty buffer.
+        """
+        self._encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._json = json.JSONDecoder()
+        self._data = ""
+        # Where the message being received starts, and how far it has been scanned, so each byte is only scanned once
+        self._start = -1
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._checked = 0
+
+    def feed(self, data: bytes) -> List[Dict[str, str]]:
+        """
+        This function will add received bytes to the buffer and return every message that is now complete.
+
+        Args:
+            data (bytes): The bytes received from the socket.
+
+        Returns:
+            List[Dict[str, str]]: The complete messages, in the order they were sent.
+        """
+        self._data += self._decoder.decode(data)
+        messages = []
+        while True:
+            if self._start == -1:
+                start = self._data.find("{", self._pos)
+                if start == -1:
+                    self._data = ""
+                    self._pos = 0
+                    break
+                self._start = self._pos = start
+                self._depth = 0
+                self._in_string = False
+                self._checked = 0
+            end = self._scan()
+            if end == -1:
+                size = len(self._data) - self._start
+                if size >= self.MAX_PENDING or (
+                    size >= max(self._MIN_CHECK, 2 * self._checked) and not self._is_incomplete()
+                ):
+                    self._skip()  # Never going to be a valid message
+                    continue
+                # Wait for the rest of the message, dropping everything before it
+                self._pos -= self._start
+                self._data = self._data[self._start :]
+                self._start = 0
+                break
+            try:
+                message, _ = self._json.raw_decode(self._data, self._start)
+            except json.JSONDecodeError:
+                self._skip()  # Not valid JSON, skip ahead to the next message
+                continue
+            if isinstance(message, dict):
+                messages.append(message)
+            self._start = -1
+            self._pos = end
+        return messages
+
+    def _scan(self) -> int:
+        """
+        This function will continue scanning the message being received for the brace that closes it.
+
+        Returns:
+            int: The index just past the closing brace, or -1 if it has not arrived yet.
+        """
+        data = self._data
+        pos = self._pos
+        depth = self._depth
+        in_string = self._in_string
+        end = -1
+        while True:
+            if in_string:
+                match = _STRING_END.search(data, pos)
+                if match is None:
+                    pos = len(data)
+                    break
+                if match.group() == "\\":
+                    if match.end() == len(data):
+                        pos = match.start()  # The escaped character has not arrived yet
+                        break
+                    pos = match.end() + 1
+                    continue
+                in_string = False
+                pos = match.end()
+                continue
+            match = _STRUCTURE.search(data, pos)
+            if match is None:
+                pos = len(data)
+                break
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    end = pos
+                    break
+        self._pos = pos
+        self._depth = depth
+        self._in_string = in_string
+        return end
+
+    def _skip(self):
+        """
+        This function will give up on the message being received and look for the next one after its opening brace.
+        """
+        self._pos = self._start + 1
+        self._start = -1
+
+    def _is_incomplete(self) -> bool:
+        """
+        This function will return whether the partial message being received is still valid JSON so far.
+        """
+        self._checked = len(self._data) - self._start
+        try:
+            self._json.raw_decode(self._data, self._start)
+        except json.JSONDecodeError as e:
+            return self._is_truncated(e)
+        return True
+
+    def pending(self) -> bytes:
+        """
+        This function will return the bytes received but not yet returned as a message, so they can be handed on.
+        """
+        return self._data.encode(self._encoding) + self._decoder.getstate()[0]
+
+    def _is_truncated(self, error: json.JSONDecodeError) -> bool:
+        """
+        This function will return whether a decoding error was caused by the message being cut off rather than invalid.
+        """
+        # A \uXXXX escape split across reads fails a few characters before the end
+        return error.pos >= len(self._data) - 6 or error.msg.startswith(
+            "Unterminated string"
+        )
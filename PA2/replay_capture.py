@@ -0,0 +1,53 @@
+from server import *
+from capture import CaptureReplayer, read_capture
+import argparse
+import json
+import socket
+import threading
+import time
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays traffic captured with launch_server.py --capture against a server")
+    parser.add_argument("capture", type=str, help="Capture file to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (0 replays as fast as possible)")
+    parser.add_argument("--ip", type=str, default=None, help="Address of a running server (a fresh in-process server is started if omitted)")
+    parser.add_argument("--port", type=int, default=8080, help="Port of the running server")
+    parser.add_argument("--output", type=str, default=None, help="Write the report to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None, help="Report from an earlier replay to compare against")
+    args = parser.parse_args()
+
+    if args.ip is None:
+        addr = ("localhost", free_port())
+        server = Server(host=addr[0], port=addr[1])
+        server_thread = threading.Thread(target=server.start)
+        server_thread.daemon = True
+        server_thread.start()
+        time.sleep(0.5)  # Give the server time to start listening
+    else:
+        addr = (args.ip, args.port)
+
+    report = CaptureReplayer(list(read_capture(args.capture)), addr, args.speed).run()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    for key, value in report.items():
+        line = f"{key:>22}: {value:14.3f}"
+        if key in baseline:
+            delta = value - baseline[key]
+            percent = f" ({delta / baseline[key] * 100:+.1f}%)" if baseline[key] else ""
+            line += f"   delta {delta:+14.3f}{percent}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
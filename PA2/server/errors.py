@@ -0,0 +1,2 @@
+class HandoverStarted(Exception):
+    """Raised in a client thread when the server starts handing its connections to a new process."""
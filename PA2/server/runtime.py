@@ -3,30 +3,144 @@ import threading
 import logging
 import json
 import re
-from groups import Group
+import time
+import itertools
+import os
+import struct
+import select
+import selectors
+import queue
+import base64
+from groups import Group, GroupRegistry
+from message_log import MessageLog, RetentionPolicy
+from snapshot import SnapshotStore
+from capture import TrafficRecorder, OPEN, DATA, CLOSE
+from protocol import FrameBuffer
+from pipeline import MessagePipeline
+from handover import ACK, fd_passing_supported, receive_state, send_state
+from memory import MemoryLimits, pending_output, LEVEL_NAMES, NORMAL, TRIM, REFUSE_GROUPS, DISCONNECT
+from server.errors import HandoverStarted
 from typing import Dict, Tuple, List
 
 
 class Server:
     """This class will handle the server side of the chat application. It will handle multiple clients and will send messages to all connected clients."""
 
+    # Commands that only touch server state and reply to the caller, so a run of them in a batch can share one lock acquisition
+    BATCH_LOCKABLE_COMMANDS = {
+        "!join",
+        "!get_groups",
+        "!get_members",
+        "!get_message",
+        "!switch",
+        "!leave",
+        "!help",
+        "!stats",
+    }
+    BATCH_LOCK_RUN = 32  # Most batched commands run under one acquisition of the lock
+    BATCH_REPLY_BYTES = FrameBuffer.MAX_PENDING // 2  # Batch results past this size go out in another frame
+
     # Initialize the server class
-    def __init__(self, host="localhost", port=8080):
+    def __init__(
+        self,
+        host="localhost",
+        port=8080,
+        snapshot_dir: str = None,
+        snapshot_interval: float = 30.0,
+        idle_timeout: float = 300.0,
+        capture_path: str = None,
+        unix_path: str = None,
+        allowed_uids: List[int] = None,
+        pipeline: MessagePipeline = None,
+        handover_path: str = None,
+        handover_timeout: float = 10.0,
+        retention: RetentionPolicy = None,
+        group_retention: Dict[str, RetentionPolicy] = None,
+        compaction_interval: float = 60.0,
+        backlog: int = socket.SOMAXCONN,
+        recv_buffer: int = None,
+        send_buffer: int = None,
+        handshake_timeout: float = None,
+        memory_limits: MemoryLimits = None,
+        memory_interval: float = 5.0,
+    ):
         self.addr = (host, port)
+        # Listener tuning for reconnect storms; accepted sockets inherit the buffer sizes from the listener
+        self.backlog = backlog
+        self.recv_buffer = recv_buffer
+        self.send_buffer = send_buffer
+        self.handshake_timeout = handshake_timeout  # Seconds a connection may take to send its name, None for no limit
+        self._accepted = queue.SimpleQueue()  # Connections waiting for the handshake stage
+        self._doorbell_r, self._doorbell_w = socket.socketpair()  # Wakes the handshake stage when one is queued
+        self._doorbell_w.setblocking(False)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Optional Unix domain socket listener for bots on the same host, serving the same protocol
+        self.unix_path = unix_path
+        self.unix_socket = None
+        if unix_path:
+            if not hasattr(socket, "AF_UNIX"):
+                raise OSError("Unix domain sockets are not supported on this platform")
+            self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # When set, Unix socket peers must run as one of these uids (checked with SO_PEERCRED)
+        self.allowed_uids = set(allowed_uids) if allowed_uids is not None else None
+        if self.allowed_uids is not None and not hasattr(socket, "SO_PEERCRED"):
+            raise OSError("SO_PEERCRED is not supported on this platform")
         self.clients: Dict[
             socket.socket, Tuple[str, str]
         ] = {}  # Use a dictionary to store connected clients
+        self.directory: Dict[str, socket.socket] = {}  # Connected users by name
+        self.direct_logs: Dict[Tuple[str, str], MessageLog] = {}  # Direct messages by pair of users
         self._logger = logging.getLogger(__name__)
         self._format = "utf-8"
-        self.lock = threading.Lock()  # Use an instance lock for thread safety
-        self.groups: Dict[str, Group] = {
-            "default": Group("default", "default"),
-            "group_1": Group("group_1", "group 1"),
-            "group_2": Group("group_2", "group 2"),
-            "group_3": Group("group_3", "group 3"),
-            "group_4": Group("group_4", "group 4"),
+        self.lock = threading.RLock()  # Use an instance lock for thread safety (re-entrant so batches can hold it)
+        self._replies = threading.local()  # Replies collected for the batch a client thread is running
+        self.snapshot_interval = snapshot_interval
+        # Groups are loaded from the snapshot directory on first access, so startup does not depend on how many exist
+        self.groups = GroupRegistry(
+            SnapshotStore(snapshot_dir) if snapshot_dir else None,
+            defaults={
+                "default": "default",
+                "group_1": "group 1",
+                "group_2": "group 2",
+                "group_3": "group 3",
+                "group_4": "group 4",
+            },
+            idle_timeout=idle_timeout,
+        )
+        # When set, everything clients send is recorded so it can be replayed with replay_capture.py
+        self._recorder = TrafficRecorder(capture_path) if capture_path else None
+        # Group messages are run through the pipeline's stages before they are stored and fanned out
+        self.pipeline = pipeline
+        self._connection_ids = itertools.count(1)
+        # Old messages outside these policies are dropped by a background thread; ids of dropped messages report expired
+        self.retention = retention
+        self.group_retention: Dict[str, RetentionPolicy] = dict(group_retention or {})
+        self.compaction_interval = compaction_interval
+        self.retention_stats = {"runs": 0, "evicted": 0, "reclaimed_bytes": 0}
+        # Approximate memory use is checked against these marks, shedding more load the higher it gets
+        self.memory_limits = memory_limits
+        self.memory_interval = memory_interval
+        self.memory_level = NORMAL
+        self.shed_stats = {
+            "paged_messages": 0,
+            "trimmed_messages": 0,
+            "paged_out": 0,
+            "refused_groups": 0,
+            "disconnected": 0,
         }
+        # A server started with the same handover path takes over this one's sockets instead of dropping clients
+        self.handover_path = handover_path
+        self.handover_timeout = handover_timeout
+        if handover_path and not fd_passing_supported():
+            raise OSError("Handing sockets to another process is not supported on this platform")
+        self._handover_socket = None
+        self._handing_over = False
+        self._handed_over = False
+        self._parked: List[Tuple[socket.socket, Dict]] = []  # Connections waiting to be handed over
+        self._wakeup_r, self._wakeup_w = socket.socketpair()  # Written to once to stop every waiting thread
+        self._workers = 0  # Accept loops and client threads currently running
+        self._workers_idle = threading.Condition()
+        self._stopped = threading.Event()
 
     def new_group(self, group_name: str, original_name: str):
         """Adds a group to the server.
@@ -48,6 +162,31 @@ class Server:
     ):
         """Sends a message to all connected clients.
 
+        Args:
+            client (socket.socket): The client socket.
+            message (str): The message to send.
+            group_name (str): The name of the group to send the message to.
+            to_caller (bool): Whether or not to send the message to the caller.
+        """
+        if not to_caller and self.pipeline:
+            # The sender's thread only queues the message; a pipeline thread stores and sends it once processed
+            self.pipeline.submit(
+                group_name,
+                message,
+                lambda processed: self._deliver(client, processed, group_name),
+            )
+            return
+        self._deliver(client, message, group_name, to_caller)
+
+    def _deliver(
+        self,
+        client: socket.socket,
+        message: dict[str, str],
+        group_name: str = "default",
+        to_caller: bool = False,
+    ):
+        """Stores a message in its group and sends it to the group's members, or just to the caller.
+
         Args:
             client (socket.socket): The client socket.
             message (str): The message to send.
@@ -84,6 +223,8 @@ class Server:
                 json_data["subject"] = message["subject"]
         except KeyError:
             pass
+        if message.get("links"):  # Added by the pipeline's link extraction stage
+            json_data["links"] = message["links"]
 
         if not to_caller:
             with self.lock:
@@ -101,12 +242,16 @@ class Server:
         json_string = json.dumps(json_data)  # Convert the dictionary to a JSON string
 
         if not to_caller:
-            users = self.groups[group_name].get_all_users().values()
+            with self.lock:  # Copied so members leaving during the sends cannot change it under us
+                users = list(self.groups[group_name].get_all_users().values())
             for c in users:
                 if c[0] != client:
-                    self._send_message(
-                        c[0], json_string
-                    )  # Send the JSON string to other clients
+                    try:
+                        self._send_message(
+                            c[0], json_string
+                        )  # Send the JSON string to other clients
+                    except OSError:
+                        pass  # The member is going away; its own thread removes it from the group
         else:
             # TODO error here
             self._send_message(
@@ -120,6 +265,10 @@ class Server:
             client (socket.socket): The client socket.
             dump (str): The message to send.
         """
+        replies = getattr(self._replies, "frames", None)
+        if replies is not None and client is self._replies.client:
+            replies.append(dump)  # Sent with the rest of the batch's results
+            return
         client.sendall(dump.encode(encoding=self._format))
 
     def send_last_two_messages(self, client: socket.socket, group_name: str):
@@ -144,10 +293,10 @@ class Server:
         _, address = self.clients[client]
         with self.lock:
             self.groups[group_name].join(user_name, (client, address))
+            members = [str(key) for key in self.groups[group_name].get_all_users().keys()]
         user_message = {
             "name": "Server",
-            "message": "Members: "
-            + str([str(key) for key in self.groups[group_name].get_all_users().keys()]),
+            "message": "Members: " + str(members),
         }
         self.send_message(client, user_message, to_caller=True)
         self.send_last_two_messages(client, group_name)
@@ -158,7 +307,7 @@ class Server:
         Returns:
             List[str]: A list of all original group names.
         """
-        return [group.get_original_name() for group in self.groups.values()]
+        return self.groups.original_names()
 
     def get_all_stored_groups(self) -> List[str]:
         """Returns a list of all stored group names.
@@ -176,16 +325,64 @@ class Server:
             address (str): The address of the client.
             name (str): The name of the client.
         """
-        self.clients.pop(client)
+        registered_name, _ = self.clients.pop(client)
+        if self.directory.get(registered_name) is client:
+            del self.directory[registered_name]
         user_message = {
             "name": "CLIENT DISCONNECTED",
             "message": name + " disconnected.",
         }
-        for group in self.groups.values():
+        for group in self.groups.resident():
             if group.is_user_in_group(name):  # If the user is in the group,
                 group.leave(name)  # Remove the user from the group
         return user_message
 
+    def direct_message(
+        self, client: socket.socket, sender: str, recipient: str, message: dict[str, str]
+    ):
+        """Sends a message straight to one connected user and stores it in the log shared by the pair.
+
+        Args:
+            client (socket.socket): The sender's socket.
+            sender (str): The name of the sender.
+            recipient (str): The name of the recipient.
+            message (dict[str, str]): The message to send.
+        """
+        target = self.directory.get(recipient)
+        if target is None:
+            user_message = {
+                "name": "Server",
+                "message": f"User '{recipient}' is not connected.",
+            }
+            self.send_message(client, user_message, to_caller=True)
+            return
+        pair = (sender, recipient) if sender <= recipient else (recipient, sender)
+        with self.lock:
+            log = self.direct_logs.get(pair)
+            if log is None:
+                log = self.direct_logs[pair] = MessageLog("DM")
+            log.add_message(message)
+        json_data = {
+            "name": sender,
+            "message": message["message"],
+            "subject": message["subject"],
+            "group": "DM",
+            "id": message["id"],
+            "date": message["date"],
+        }
+        try:
+            self._send_message(target, json.dumps(json_data))
+        except OSError as e:
+            self._logger.error(f"Error sending direct message to {recipient}: {e}")
+            user_message = {
+                "name": "Server",
+                "message": f"Could not deliver the message to '{recipient}'.",
+            }
+            self.send_message(client, user_message, to_caller=True)
+            return
+        json_data["to"] = recipient  # Echoed back to the sender as confirmation
+        self._send_message(client, json.dumps(json_data))
+
     def get_message_by_id(self, id: int, group_name: str) -> dict[str, str]:
         """Returns a message by its id.
 
@@ -199,191 +396,266 @@ class Server:
         with self.lock:
             return self.groups[group_name].get_message_by_id(id)
 
-    def handle_client(self, client: socket.socket, address):
-        """Will handle a client connection. This function will run in a separate thread.
+    def _recv(self, client: socket.socket, connection_id: int) -> bytes:
+        """Receives data from a client, recording it if traffic capture is enabled.
 
         Args:
             client (socket.socket): The client socket.
-            address (str): The address of the client.
+            connection_id (int): The id of the connection.
+
+        Returns:
+            bytes: The data received. Empty if the client closed the connection.
         """
-        self._logger.info(
-            f"[NEW CONNECTION] {address} connected."
-        )  # Log the connection
-        # Send an initial message to the client
-        initial_msg = {
-            "name": "Server",
-            "message": "Successfully connected to the server. Type !help for a list of commands.",
-            "subject": "",
+        if self.handover_path:
+            self._wait_readable(client)
+        data = client.recv(1024)  # Receive 1024 bytes of data
+        if self._recorder and data:  # The end of the connection is recorded as CLOSE
+            self._recorder.record(DATA, connection_id, data)
+        return data
+
+    def get_stats(self) -> Dict[str, object]:
+        """Returns counters describing the server's current state.
+
+        Returns:
+            Dict[str, object]: The statistics, grouped by subsystem.
+        """
+        stats = {
+            "clients": len(self.clients),
+            "resident_groups": len(self.groups.resident()),
+            "users": len(self.directory),
+            "direct_conversations": len(self.direct_logs),
         }
-        initial_msg_string = json.dumps(
-            initial_msg
-        )  # Convert the dictionary to a JSON string
-        client.send(
-            initial_msg_string.encode(encoding=self._format)
-        )  # Send the JSON string
+        if self.pipeline:
+            stats["pipeline"] = self.pipeline.get_stats()
+        stats["memory"] = self._memory_stats(self.get_memory_usage())
+        if self.retention or self.group_retention:
+            stats["retention"] = dict(
+                self.retention_stats,
+                retained=sum(group.get_num_messages() for group in self.groups.resident()),
+            )
+        return stats
 
-        # Send the last 2 messages in the group to the client
-        self.send_last_two_messages(client, "default")
+    def _register(self, client: socket.socket, address, user_name: str) -> str:
+        """Adds a newly named client to the user directory and the default group.
 
-        connected = True
-        msg = client.recv(1024).decode(self._format)  # Receive 1024 bytes of data
-        received_json = json.loads(msg)  # Convert the JSON string to a dictionary
-        user_name = received_json["name"]
+        Args:
+            client (socket.socket): The client socket.
+            address (str): The address of the client.
+            user_name (str): The name the client asked for.
+
+        Returns:
+            str: The user's name, or None if the name is already in use.
+        """
         with self.lock:
-            self.groups["default"].join(user_name, (client, address))
-            self.clients.update({client: [user_name, address]})
-        join_msg = {"name": "Server", "message": user_name + " has joined the chat."}
-        self.send_message(client, join_msg)  # Send the message to all connected clients
-        current_group = "default"
-        while connected:
-            try:
-                user_message_string = client.recv(1024).decode(
-                    self._format
-                )  # Receive 1024 bytes of data
+            name_taken = user_name in self.directory
+            if name_taken:
+                self.clients.pop(client, None)
+            else:
+                self.directory[user_name] = client
+                self.groups["default"].join(user_name, (client, address))
+                self.clients.update({client: [user_name, address]})
+        if name_taken:  # Names must be unique so direct messages reach the right user
+            self._logger.info(f"[REJECTED] {address} tried to use the name {user_name}.")
+            user_message = {
+                "name": "Server",
+                "message": f"The name '{user_name}' is already in use. Reconnect with a different name.",
+            }
+            self.send_message(client, user_message, to_caller=True)
+            return None
+        return user_name
 
-                messages = self.parse_json_string(
-                    user_message_string
-                )  # Parse the JSON string
+    def _wait_readable(self, sock: socket.socket):
+        """Blocks until a socket is readable, raising HandoverStarted if a handover begins first.
 
-                for user_message in messages:
-                    if not user_message["message"]:  # If the message is empty,
-                        continue  # Skip the rest of the loop
+        Args:
+            sock (socket.socket): The socket to wait on.
+        """
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        poller.register(self._wakeup_r, select.POLLIN)
+        poller.poll()
+        if self._handing_over:
+            raise HandoverStarted()
 
-                    command = user_message["message"].split(" ")[0].lower()
+    def handle_message(
+        self, client: socket.socket, user_message: dict[str, str], current_group: str
+    ) -> Tuple[str, bool]:
+        """Runs a single message or command received from a client.
 
-                    if command == "!disconnect":  # If the user wants to disconnect,
-                        with self.lock:
-                            connected = False
-                            user_message = self.disconnect(client, user_message["name"])
+        Args:
+            client (socket.socket): The client socket.
+            user_message (dict[str, str]): The message received.
+            current_group (str): The group plain messages are sent to.
+
+        Returns:
+            Tuple[str, bool]: The client's current group afterwards and whether it is still connected.
+        """
+        connected = True
+        if not user_message["message"]:  # If the message is empty,
+            return current_group, connected  # Skip empty messages
 
-                    if command == "!join":
-                        string = user_message.get("message", "")
-                        match = re.search(r"'([^']+?)'", string)
+        command = user_message["message"].split(" ")[0].lower()
 
-                        if match:
-                            group_name = (
-                                match.group(1).replace(" ", "_").replace("'", "")
-                            )
-                            if group_name not in self.get_all_stored_groups():
-                                self.new_group(group_name, match.group(1))
-                            self.join_group(client, group_name, user_message["name"])
-                        continue
+        if command == "!disconnect":  # If the user wants to disconnect,
+            with self.lock:
+                connected = False
+                user_message = self.disconnect(client, user_message["name"])
 
-                    if command == "!get_message":
-                        string = user_message.get("message", "")
-                        matches: List[str] = re.findall(r"'([^']+?)'", string)
-                        if matches:
-                            message_id = int(matches[0])
-                            group_name = matches[1].replace(" ", "_")
-                            user_message = self.get_message_by_id(
-                                message_id, group_name
-                            )
-                            self.send_message(
-                                client, user_message, group_name, to_caller=True
-                            )
-                        continue
+        if command == "!join":
+            string = user_message.get("message", "")
+            match = re.search(r"'([^']+?)'", string)
 
-                    if command == "!get_groups":
+            if match:
+                group_name = (
+                    match.group(1).replace(" ", "_").replace("'", "")
+                )
+                if group_name not in self.groups:
+                    if self.memory_level >= REFUSE_GROUPS:
+                        self.shed_stats["refused_groups"] += 1
                         user_message = {
                             "name": "Server",
-                            "message": "Groups: " + str(self.get_all_original_groups()),
+                            "message": "The server is low on memory, so new groups cannot be created right now.",
                         }
                         self.send_message(client, user_message, to_caller=True)
-                        continue
+                        return current_group, connected
+                    self.new_group(group_name, match.group(1))
+                self.join_group(client, group_name, user_message["name"])
+            return current_group, connected
 
-                    if command == "!get_members":
-                        string = user_message.get("message", "")
-                        match = re.search(r"'([^']+?)'", string)
-                        if match:
-                            group_name = match.group(1).replace(" ", "_")
-                            user_message = {
-                                "name": "Server",
-                                "message": "Members: "
-                                + str(
-                                    [
-                                        member
-                                        for member in self.groups[group_name]
-                                        .get_all_users()
-                                        .keys()
-                                    ]
-                                ),
-                            }
-                            self.send_message(client, user_message, to_caller=True)
-                        continue
+        if command == "!get_message":
+            string = user_message.get("message", "")
+            matches: List[str] = re.findall(r"'([^']+?)'", string)
+            if matches:
+                message_id = int(matches[0])
+                group_name = matches[1].replace(" ", "_")
+                user_message = self.get_message_by_id(
+                    message_id, group_name
+                )
+                self.send_message(
+                    client, user_message, group_name, to_caller=True
+                )
+            return current_group, connected
 
-                    if command == "!send":
-                        string = user_message.get("message", "")
-                        matches = re.findall(r"'([^']+?)'", string)
-                        if matches:
-                            group_length = len(matches[0]) + 2
-                            group_name = matches[0].replace(" ", "_").replace("'", "")
-                            command_length = len(command) + group_length + 2
-
-                            subject = user_message["subject"]
-                            subject_length = len(subject)
-                            if len(matches) > 1:
-                                subject_length = len(matches[1]) + 3
-                                subject = matches[1]
-
-                            message = user_message["message"][
-                                command_length + subject_length :
-                            ]
-
-                            user_message = {
-                                "name": user_message["name"],
-                                "message": message,
-                                "subject": subject,
-                            }
-
-                            self.send_message(
-                                client,
-                                user_message,
-                                group_name,
-                            )
-                            continue
-
-                    if command == "!switch":
-                        string = user_message.get("message", "")
-                        match = re.search(r"'([^']+?)'", string)
-                        if match:
-                            group_name = match.group(1).replace(" ", "_")
-                            users = self.groups[group_name].get_all_users().keys()
-                            if (group_name in self.get_all_stored_groups()) and (
-                                user_message["name"] in users
-                            ):
-                                current_group = group_name
-                                client_msg = {
-                                    "name": "Server",
-                                    "message": "New Server: " + current_group,
-                                }
-                                self.send_message(client, client_msg, to_caller=True)
-                            # TODO - add a message indicating user doesn't belong to group or the group doesn't exist
-                        continue
+        if command == "!get_groups":
+            user_message = {
+                "name": "Server",
+                "message": "Groups: " + str(self.get_all_original_groups()),
+            }
+            self.send_message(client, user_message, to_caller=True)
+            return current_group, connected
 
-                    if command == "!leave":
-                        string = user_message.get("message", "")
-                        match = re.search(r"'([^']+?)'", string)
-                        if match:
-                            group_name = match.group(1).replace(" ", "_")
-                            if group_name in self.get_all_stored_groups():
-                                self.groups[group_name].leave(user_message["name"])
-                                if group_name == current_group:
-                                    current_group = "default"
-                                    client_msg = {
-                                        "name": "Server",
-                                        "message": "New Server: " + current_group,
-                                    }
-                                    self.send_message(client, client_msg, to_caller=True)
-                        continue
+        if command == "!get_members":
+            string = user_message.get("message", "")
+            match = re.search(r"'([^']+?)'", string)
+            if match:
+                group_name = match.group(1).replace(" ", "_")
+                with self.lock:
+                    members = list(self.groups[group_name].get_all_users().keys())
+                user_message = {
+                    "name": "Server",
+                    "message": "Members: " + str(members),
+                }
+                self.send_message(client, user_message, to_caller=True)
+            return current_group, connected
+
+        if command == "!send":
+            string = user_message.get("message", "")
+            matches = re.findall(r"'([^']+?)'", string)
+            if matches:
+                group_length = len(matches[0]) + 2
+                group_name = matches[0].replace(" ", "_").replace("'", "")
+                command_length = len(command) + group_length + 2
+
+                subject = user_message["subject"]
+                subject_length = len(subject)
+                if len(matches) > 1:
+                    subject_length = len(matches[1]) + 3
+                    subject = matches[1]
+
+                message = user_message["message"][
+                    command_length + subject_length :
+                ]
+
+                user_message = {
+                    "name": user_message["name"],
+                    "message": message,
+                    "subject": subject,
+                }
+
+                self.send_message(
+                    client,
+                    user_message,
+                    group_name,
+                )
+                return current_group, connected
 
-                    if command == "!help":
-                        help_message = """
+        if command == "!switch":
+            string = user_message.get("message", "")
+            match = re.search(r"'([^']+?)'", string)
+            if match:
+                group_name = match.group(1).replace(" ", "_")
+                users = self.groups[group_name].get_all_users().keys()
+                if (group_name in self.groups) and (
+                    user_message["name"] in users
+                ):
+                    current_group = group_name
+                    client_msg = {
+                        "name": "Server",
+                        "message": "New Server: " + current_group,
+                    }
+                    self.send_message(client, client_msg, to_caller=True)
+                # TODO - add a message indicating user doesn't belong to group or the group doesn't exist
+            return current_group, connected
+
+        if command == "!leave":
+            string = user_message.get("message", "")
+            match = re.search(r"'([^']+?)'", string)
+            if match:
+                group_name = match.group(1).replace(" ", "_")
+                if group_name in self.groups:
+                    self.groups[group_name].leave(user_message["name"])
+                    if group_name == current_group:
+                        current_group = "default"
+                        client_msg = {
+                            "name": "Server",
+                            "message": "New Server: " + current_group,
+                        }
+                        self.send_message(client, client_msg, to_caller=True)
+            return current_group, connected
+
+        if command == "!dm":
+            user_name = self.clients[client][0]  # The registered name, not the one in the frame
+            string = user_message.get("message", "")
+            match = re.match(r"\S+\s+'([^']+?)'\s?(.*)", string, re.DOTALL)
+            if match and match.group(2):
+                self.direct_message(
+                    client,
+                    user_name,
+                    match.group(1),
+                    {
+                        "name": user_name,
+                        "message": match.group(2),
+                        "subject": user_message.get("subject", ""),
+                    },
+                )
+            return current_group, connected
+
+        if command == "!stats":
+            user_message = {
+                "name": "Server",
+                "message": "Stats: " + json.dumps(self.get_stats()),
+            }
+            self.send_message(client, user_message, to_caller=True)
+            return current_group, connected
+
+        if command == "!help":
+            help_message = """
 
 Messages must be entered in the following format:
     'subject' message               (subject is an optional field)
 
 Group names may not contain special characters: 
-                                    (use underscores instead) 
+                        (use underscores instead) 
 
 Commands:                           
     !get_groups                     (get a list of the groups created)
@@ -392,73 +664,963 @@ Commands:
     !get_members 'group_name'       (return the members of a group)
     !leave 'group_name'             (leave group)
     !get_message 'id' 'group_name'  (get message with id from a group)
+    !dm 'user' message              (send a private message to a connected user)
     !switch 'group_name'            (switch current message context to a different group)
+    !stats                          (display server statistics)
+    !batch command; command; ...    (run several commands and get all their results at once)
     !disconnect                     (disconnect from the server)
     !help                           (display this help message)
 """
 
-                        user_message = {
-                            "name": "Server",
-                            "message": help_message,
-                            "subject": "",
-                        }
-                        self.send_message(client, user_message, to_caller=True)
-                        continue
+            user_message = {
+                "name": "Server",
+                "message": help_message,
+                "subject": "",
+            }
+            self.send_message(client, user_message, to_caller=True)
+            return current_group, connected
+
+        self.send_message(
+            client, user_message, current_group
+        )  # Send the message to all connected clients
+        return current_group, connected
+
+    def _run_batched_command(
+        self,
+        client: socket.socket,
+        name: str,
+        command: str,
+        current_group: str,
+        results: List[str],
+    ) -> Tuple[str, bool]:
+        """Runs one command of a batch, adding its replies to results as a JSON object.
+
+        Returns:
+            Tuple[str, bool]: The client's current group afterwards and whether it is still connected.
+        """
+        self._replies.frames = []
+        connected = True
+        try:
+            current_group, connected = self.handle_message(
+                client, {"name": name, "message": command, "subject": ""}, current_group
+            )
+        except Exception as e:  # Report the failure as this command's result and carry on with the batch
+            self._logger.error(f"Error handling batched command: {e}")
+            self._replies.frames.append(
+                json.dumps({"name": "Server", "message": f"Error running {command}", "subject": ""})
+            )
+        results.append(
+            '{"command": '
+            + json.dumps(command)
+            + ', "results": ['
+            + ", ".join(self._replies.frames)
+            + "]}"
+        )
+        return current_group, connected
+
+    def run_batch(
+        self, client: socket.socket, batch_message: dict, current_group: str
+    ) -> Tuple[str, bool]:
+        """Runs the commands of a batch frame in order and replies with frames holding every command's results.
+        Consecutive commands from BATCH_LOCKABLE_COMMANDS run under one acquisition of the lock, up to BATCH_LOCK_RUN
+        at a time; anything that sends to other clients runs on its own. Results are sent in one frame unless they
+        grow past BATCH_REPLY_BYTES, so no frame is too large for the client to read.
 
-                    self.send_message(
-                        client, user_message, current_group
-                    )  # Send the message to all connected clients
+        Args:
+            client (socket.socket): The client socket.
+            batch_message (dict): The batch frame, with the commands in its "batch" list.
+            current_group (str): The group plain messages are sent to.
+
+        Returns:
+            Tuple[str, bool]: The client's current group afterwards and whether it is still connected.
+        """
+        name = batch_message.get("name", "")
+        commands = [
+            command for command in batch_message.get("batch", []) if isinstance(command, str)
+        ]
+        lockable = [
+            command.split(" ")[0].lower() in self.BATCH_LOCKABLE_COMMANDS
+            for command in commands
+        ]
+        results: List[str] = []
+        size = 0
+        sent = False
+        connected = True
+        self._replies.client = client
+        try:
+            index = 0
+            while index < len(commands) and connected:
+                if lockable[index]:
+                    end = min(len(commands), index + self.BATCH_LOCK_RUN)
+                    with self.lock:
+                        while True:
+                            current_group, connected = self._run_batched_command(
+                                client, name, commands[index], current_group, results
+                            )
+                            size += len(results[-1])
+                            index += 1
+                            if (
+                                index == end
+                                or not lockable[index]
+                                or not connected
+                                or size >= self.BATCH_REPLY_BYTES
+                            ):
+                                break
+                else:
+                    current_group, connected = self._run_batched_command(
+                        client, name, commands[index], current_group, results
+                    )
+                    size += len(results[-1])
+                    index += 1
+                if connected and size >= self.BATCH_REPLY_BYTES:
+                    self._send_batch_results(client, results)  # Never sent while holding the lock
+                    results = []
+                    size = 0
+                    sent = True
+        finally:
+            self._replies.frames = None
+        if connected and (results or not sent):
+            self._send_batch_results(client, results)
+        return current_group, connected
+
+    def _send_batch_results(self, client: socket.socket, results: List[str]):
+        """Sends the results of some of a batch's commands to the client as one frame.
+
+        Args:
+            client (socket.socket): The client socket.
+            results (List[str]): Each command's results as a JSON object.
+        """
+        response = (
+            '{"name": "Server", "message": "", "subject": "", "batch": ['
+            + ", ".join(results)
+            + "]}"
+        )
+        client.sendall(response.encode(encoding=self._format))
+
+    def _open_connection(self) -> int:
+        """Assigns an id to a new connection, recording it if traffic capture is enabled.
+
+        Returns:
+            int: The id of the connection.
+        """
+        connection_id = next(self._connection_ids)
+        if self._recorder:
+            self._recorder.record(OPEN, connection_id)
+        return connection_id
+
+    def _greet(self, client: socket.socket, address):
+        """Sends the welcome message and the default group's last two messages to a new client.
+
+        Args:
+            client (socket.socket): The client socket.
+            address (str): The address of the client.
+        """
+        self._logger.info(f"[NEW CONNECTION] {address} connected.")  # Log the connection
+        # Send an initial message to the client
+        initial_msg = {
+            "name": "Server",
+            "message": "Successfully connected to the server. Type !help for a list of commands.",
+            "subject": "",
+        }
+        initial_msg_string = json.dumps(initial_msg)  # Convert the dictionary to a JSON string
+        client.sendall(initial_msg_string.encode(encoding=self._format))  # Send the JSON string
+
+        # Send the last 2 messages in the group to the client
+        self.send_last_two_messages(client, "default")
+
+    def handle_client(
+        self,
+        client: socket.socket,
+        address,
+        session: Dict = None,
+        handshake: Tuple[int, FrameBuffer, List[Dict]] = None,
+    ):
+        """Will handle a client connection. This function will run in a separate thread.
+
+        Args:
+            client (socket.socket): The client socket.
+            address (str): The address of the client.
+            session (Dict): The state of a connection taken over from another server process, if any.
+            handshake (Tuple[int, FrameBuffer, List[Dict]]): The connection id, buffer and first messages of a
+                connection that already went through the handshake stage, if any.
+        """
+        user_name = None
+        current_group = "default"
+        pending = []
+        if handshake is not None:
+            connection_id, frames, pending = handshake
+        else:
+            connection_id = self._open_connection()
+            frames = FrameBuffer(self._format)  # Frames may arrive split or several per read
+            if session is None:
+                self._greet(client, address)
+            else:
+                # Taken over from another process, which already greeted the client
+                frames.feed(base64.b64decode(session["buffer"]))
+                user_name = session["name"]
+                current_group = session["current_group"]
+
+        connected = True
+        while user_name is None and not pending:
+            try:
+                data = self._recv(client, connection_id)
+            except HandoverStarted:
+                self._park_session(client, address, None, current_group, frames)
+                return
+            if not data:  # The client left before sending its name
+                self._drop(client, connection_id)
+                return
+            pending = frames.feed(data)
+        if user_name is None:
+            received_json = pending.pop(0)  # Anything after the name is handled below
+            user_name = self._register(client, address, received_json["name"])
+            if user_name is None:
+                if self._recorder:
+                    self._recorder.record(CLOSE, connection_id)
+                client.close()
+                return
+            join_msg = {"name": "Server", "message": user_name + " has joined the chat."}
+            self.send_message(client, join_msg)  # Send the message to all connected clients
+        while connected:
+            try:
+                if pending:
+                    messages, pending = pending, []
+                else:
+                    try:
+                        data = self._recv(client, connection_id)
+                    except OSError as e:
+                        self._logger.error(f"Error receiving from client: {e}")
+                        data = b""
+                    if not data:  # The client went away without sending !disconnect
+                        with self.lock:
+                            connected = False
+                            user_message = self.disconnect(client, user_name)
+                        self.send_message(client, user_message, current_group)
+                        break
+                    messages = frames.feed(data)  # Parse the received frames
+
+                for user_message in messages:
+                    if "batch" in user_message:
+                        current_group, connected = self.run_batch(
+                            client, user_message, current_group
+                        )
+                    else:
+                        current_group, connected = self.handle_message(
+                            client, user_message, current_group
+                        )
+                    if not connected:
+                        break
+            except HandoverStarted:
+                self._park_session(client, address, user_name, current_group, frames)
+                return
             except Exception as e:
                 self._logger.error(f"Error handling client: {e}")
         self._logger.info(f"[DISCONNECTION] {address} disconnected.")
         self._logger.info(f"[ACTIVE CONNECTIONS] {len(self.clients)}")
+        if self._recorder:
+            self._recorder.record(CLOSE, connection_id)
+        client.close()
+
+    def save_snapshot(self):
+        """Writes changed groups to the snapshot directory and pages out groups that are empty and idle."""
+        written = self.groups.snapshot()
+        with self.lock:  # Handlers only touch groups while holding the lock
+            paged = self.groups.page_out()
+        if written or paged:
+            self._logger.info(
+                f"[SNAPSHOT] {written} group(s) written, {paged} group(s) paged out."
+            )
+
+    def _snapshot_loop(self):
+        """Daemon thread that periodically snapshots the groups."""
+        while not self._handed_over:
+            time.sleep(self.snapshot_interval)
+            if self._handed_over:
+                break
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                self._logger.error(f"Error saving snapshot: {e}")
+
+    def set_retention(self, group_name: str, policy: RetentionPolicy = None):
+        """Sets the retention policy for one group, overriding the server-wide policy.
+
+        Args:
+            group_name (str): The name of the group.
+            policy (RetentionPolicy): The policy to enforce. None goes back to the server-wide policy.
+        """
+        if policy is None:
+            self.group_retention.pop(group_name, None)
+        else:
+            self.group_retention[group_name] = policy
+
+    def compact(self) -> Dict[str, int]:
+        """Drops messages outside the retention policies from resident groups and direct message logs.
+        Logs are only locked while old messages are cut off, so senders and fan-out are not held up.
+
+        Returns:
+            Dict[str, int]: The messages evicted and retained and the approximate bytes reclaimed by this pass.
+        """
+        groups = self.groups.resident()
+        direct_logs = list(self.direct_logs.values())
+        logs = [(self.group_retention.get(group.name, self.retention), group) for group in groups]
+        logs.extend((self.retention, log) for log in direct_logs)
+        evicted = reclaimed = 0
+        for policy, log in logs:
+            if policy is not None and not policy.is_unlimited():
+                removed, freed = log.compact(policy)
+                evicted += removed
+                reclaimed += freed
+        retained = sum(group.get_num_messages() for group in groups)
+        retained += sum(len(log.messages) for log in direct_logs)
+        self.retention_stats["runs"] += 1
+        self.retention_stats["evicted"] += evicted
+        self.retention_stats["reclaimed_bytes"] += reclaimed
+        return {"evicted": evicted, "retained": retained, "reclaimed_bytes": reclaimed}
+
+    def _compaction_loop(self):
+        """Daemon thread that periodically enforces the retention policies."""
+        while not self._stopped.wait(self.compaction_interval):
+            if self._handed_over:
+                break
+            try:
+                result = self.compact()
+            except Exception as e:
+                self._logger.error(f"Error compacting message logs: {e}")
+                continue
+            if result["evicted"]:
+                self._logger.info(
+                    f"[RETENTION] {result['evicted']} message(s) evicted, {result['retained']} retained, "
+                    f"{result['reclaimed_bytes']} byte(s) reclaimed."
+                )
+
+    def get_memory_usage(self) -> Dict[str, object]:
+        """Measures the approximate bytes held by each group and each connection's unsent output.
+        Nothing here takes the server lock, so it still works while a slow client is holding up a sender.
+
+        Returns:
+            Dict[str, object]: {"groups": {name: {"messages", "members"}}, "direct_messages": bytes,
+                "connections": {socket: unsent bytes}, "total": bytes}
+        """
+        groups = {group.name: group.get_memory_usage() for group in self.groups.resident()}
+        direct_messages = sum(log.total_bytes for log in list(self.direct_logs.values()))
+        connections = {client: pending_output(client) for client in list(self.clients)}
+        total = (
+            sum(usage["messages"] + usage["members"] for usage in groups.values())
+            + direct_messages
+            + sum(connections.values())
+        )
+        return {
+            "groups": groups,
+            "direct_messages": direct_messages,
+            "connections": connections,
+            "total": total,
+        }
+
+    def _memory_stats(self, usage: Dict[str, object]) -> Dict[str, object]:
+        """Summarizes the output of get_memory_usage() for !stats.
+
+        Args:
+            usage (Dict[str, object]): The output of get_memory_usage().
+
+        Returns:
+            Dict[str, object]: Byte totals, the heaviest groups and connections, and what has been shed so far.
+        """
+        groups = sorted(
+            ((usage["messages"] + usage["members"], name) for name, usage in usage["groups"].items()),
+            reverse=True,
+        )
+        connections = sorted(
+            (
+                (pending, self.clients.get(client, [""])[0])
+                for client, pending in usage["connections"].items()
+                if pending
+            ),
+            reverse=True,
+        )
+        stats = {
+            "total_bytes": usage["total"],
+            "messages_bytes": sum(group["messages"] for group in usage["groups"].values()),
+            "members_bytes": sum(group["members"] for group in usage["groups"].values()),
+            "direct_messages_bytes": usage["direct_messages"],
+            "pending_output_bytes": sum(usage["connections"].values()),
+            "heaviest_groups": [[name, size] for size, name in groups[:3]],
+            "heaviest_connections": [[name, pending] for pending, name in connections[:3]],
+            "level": LEVEL_NAMES[self.memory_level],
+        }
+        stats.update(self.shed_stats)
+        return stats
+
+    def _trim_history(self) -> int:
+        """Pages out every group without members, then moves all but the limits' trim_messages newest messages of
+        the remaining groups to the snapshot store, where retention still applies to them. History that cannot be
+        paged out, such as direct messages or every log without a store, is only cut down if the limits allow
+        drop_history.
+
+        Returns:
+            int: The approximate bytes reclaimed.
+        """
+        limits = self.memory_limits
+        reclaimed = 0
+        droppable = list(self.direct_logs.values())
+        if self.groups.persistent:
+            if self.lock.acquire(timeout=1.0):  # Skipped if a slow client is holding the lock
+                try:
+                    before = {group.name: group for group in self.groups.resident()}
+                    self.shed_stats["paged_out"] += self.groups.page_out(idle_timeout=0)
+                    after = {group.name for group in self.groups.resident()}
+                finally:
+                    self.lock.release()
+                for name, group in before.items():
+                    if name not in after:  # Reloaded from the snapshot store the next time it is used
+                        usage = group.get_memory_usage()
+                        reclaimed += usage["messages"] + usage["members"]
+            paged, freed = self.groups.page_history(limits.trim_messages)
+            self.shed_stats["paged_messages"] += paged
+            reclaimed += freed
+        else:
+            droppable.extend(self.groups.resident())
+        if limits.drop_history:
+            policy = RetentionPolicy(max_messages=limits.trim_messages)
+            for log in droppable:
+                evicted, freed = log.compact(policy)
+                self.shed_stats["trimmed_messages"] += evicted
+                reclaimed += freed
+        return reclaimed
+
+    def _disconnect_slow_consumers(self, connections: Dict[socket.socket, int], excess: int) -> int:
+        """Disconnects the clients with the most unsent output until about excess bytes have been freed.
+
+        Args:
+            connections (Dict[socket.socket, int]): The unsent bytes of each connection.
+            excess (int): The approximate bytes to free.
+
+        Returns:
+            int: The number of clients disconnected.
+        """
+        slow = sorted(
+            (
+                (pending, client)
+                for client, pending in connections.items()
+                if pending >= self.memory_limits.slow_consumer_bytes
+            ),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        disconnected = 0
+        for pending, client in slow:
+            if excess <= 0:
+                break
+            name = self.clients.get(client, [""])[0]
+            self._logger.warning(
+                f"[MEMORY] Disconnecting slow consumer {name or client} with {pending} unsent byte(s)."
+            )
+            try:
+                client.shutdown(socket.SHUT_RDWR)  # Its thread sees the connection close and cleans up as usual
+            except OSError:
+                pass
+            excess -= pending
+            disconnected += 1
+        self.shed_stats["disconnected"] += disconnected
+        return disconnected
+
+    def shed_load(self) -> int:
+        """Measures memory use and sheds load in steps as the limits' high-water marks are crossed:
+        history is trimmed first, then !join stops creating groups, and finally slow consumers are disconnected.
+
+        Returns:
+            int: The load shedding level after this pass.
+        """
+        limits = self.memory_limits
+        usage = self.get_memory_usage()
+        used = usage["total"]
+        if limits.level(used) >= TRIM:
+            used -= self._trim_history()
+        if limits.level(used) >= DISCONNECT:
+            self._disconnect_slow_consumers(usage["connections"], used - limits.disconnect_at)
+        level = limits.level(used)
+        if level != self.memory_level:
+            self._logger.warning(
+                f"[MEMORY] About {used} byte(s) in use, load shedding is now {LEVEL_NAMES[level]}."
+            )
+        self.memory_level = level
+        return level
+
+    def _memory_loop(self):
+        """Daemon thread that periodically checks memory use against the high-water marks."""
+        while not self._stopped.wait(self.memory_interval):
+            if self._handed_over:
+                break
+            try:
+                self.shed_load()
+            except Exception as e:
+                self._logger.error(f"Error checking memory use: {e}")
+
+    def _unix_peer(self, client: socket.socket):
+        """Identifies the process on the other end of a Unix socket connection.
+
+        Args:
+            client (socket.socket): The client socket.
+
+        Returns:
+            str: The address to use for the client, or None if its uid is not allowed.
+        """
+        if not hasattr(socket, "SO_PEERCRED"):
+            return "unix"
+        credentials = client.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        pid, uid, _ = struct.unpack("3i", credentials)
+        if self.allowed_uids is not None and uid not in self.allowed_uids:
+            self._logger.warning(
+                f"[REJECTED] Unix socket peer pid={pid} uid={uid} is not allowed."
+            )
+            return None
+        return f"unix:pid={pid},uid={uid}"
+
+    def _start_handler(
+        self,
+        client: socket.socket,
+        address,
+        session: Dict = None,
+        handshake: Tuple[int, FrameBuffer, List[Dict]] = None,
+    ):
+        """Starts a thread to handle a client.
+
+        Args:
+            client (socket.socket): The client socket.
+            address (str): The address of the client.
+            session (Dict): The state of a connection taken over from another server process, if any.
+            handshake (Tuple[int, FrameBuffer, List[Dict]]): The state of a connection that finished the handshake stage, if any.
+        """
+        with self._workers_idle:
+            self._workers += 1
+        thread = threading.Thread(
+            target=self._run_worker,
+            args=(self.handle_client, client, address, session, handshake),
+        )
+        try:
+            thread.start()
+        except Exception:  # Usually too many threads; the caller decides what to do with the client
+            with self._workers_idle:
+                self._workers -= 1
+                self._workers_idle.notify_all()
+            raise
+
+    def _run_worker(self, target, *args):
+        """Runs an accept loop or client handler, keeping count of how many are running."""
+        try:
+            target(*args)
+        finally:
+            with self._workers_idle:
+                self._workers -= 1
+                self._workers_idle.notify_all()
+
+    def _accept_loop(self, listener: socket.socket):
+        """Accepts connections on a listening socket and queues them for the handshake stage.
+        Nothing here takes a lock or starts a thread, so a burst of connections is drained from the backlog quickly.
+
+        Args:
+            listener (socket.socket): The listening socket.
+        """
+        try:
+            while True:
+                if self.handover_path:
+                    self._wait_readable(listener)
+                client, address = listener.accept()
+                if listener is self.unix_socket:
+                    address = self._unix_peer(client)
+                    if address is None:
+                        client.close()
+                        continue
+                self._accepted.put((client, address))
+                try:
+                    self._doorbell_w.send(b"\0")
+                except BlockingIOError:
+                    pass  # The handshake stage already has a wakeup waiting
+        except HandoverStarted:
+            pass
+        except OSError as e:
+            if not self._stopped.is_set():
+                self._logger.error(f"Error accepting connections: {e}")
+
+    def _admit(self, client: socket.socket, address) -> int:
+        """Registers and greets a newly accepted connection.
+
+        Args:
+            client (socket.socket): The client socket.
+            address (str): The address of the client.
+
+        Returns:
+            int: The id of the connection, or None if it could not be greeted.
+        """
+        with self.lock:
+            self.clients[client] = ["", address]
+            self._logger.info(f"[ACTIVE CONNECTIONS] {len(self.clients)}")
+        connection_id = self._open_connection()
+        try:
+            self._greet(client, address)
+        except OSError:
+            self._drop(client, connection_id)
+            return None
+        return connection_id
+
+    def _drop(self, client: socket.socket, connection_id: int = None):
+        """Closes a connection that left before sending its name.
+
+        Args:
+            client (socket.socket): The client socket.
+            connection_id (int): The id of the connection, or None if it was never assigned one.
+        """
+        with self.lock:
+            self.clients.pop(client, None)
+        if self._recorder and connection_id is not None:
+            self._recorder.record(CLOSE, connection_id)
         client.close()
 
-    def parse_json_string(self, json_string: str) -> List[Dict[str, str]]:
-        # Initialize an empty list to store dictionaries
-        parsed_list = []
+    def _handshake_loop(self):
+        """Greets queued connections and waits for each to send its name, then starts a thread for the client.
+        Connections are watched with one selector until then, so slow or idle clients never hold up accepting.
+        A connection that fails here is dropped on its own; if the loop itself fails, the server stops.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self._doorbell_r, selectors.EVENT_READ)
+        selector.register(self._wakeup_r, selectors.EVENT_READ)
+        # Kept in the order connections arrived, so with a fixed timeout the first entry always expires first
+        waiting: Dict[socket.socket, Tuple[str, int, FrameBuffer, float]] = {}
+        try:
+            while not self._handing_over:
+                timeout = None
+                if self.handshake_timeout is not None and waiting:
+                    oldest = next(iter(waiting.values()))[3]
+                    timeout = max(0.0, oldest - time.monotonic())
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self._wakeup_r:
+                        continue  # A handover started
+                    if key.fileobj is self._doorbell_r:
+                        self._doorbell_r.recv(4096)
+                        while True:
+                            try:
+                                client, address = self._accepted.get_nowait()
+                            except queue.Empty:
+                                break
+                            connection_id = None
+                            try:
+                                connection_id = self._admit(client, address)
+                                if connection_id is None:
+                                    continue
+                                deadline = time.monotonic() + (self.handshake_timeout or 0.0)
+                                waiting[client] = (address, connection_id, FrameBuffer(self._format), deadline)
+                                selector.register(client, selectors.EVENT_READ)
+                            except Exception as e:
+                                self._logger.error(f"Error admitting {address}: {e}")
+                                waiting.pop(client, None)
+                                self._drop(client, connection_id)
+                        continue
+                    client = key.fileobj
+                    address, connection_id, frames, _ = waiting[client]
+                    try:
+                        try:
+                            data = client.recv(1024)
+                            if self._recorder and data:
+                                self._recorder.record(DATA, connection_id, data)
+                            messages = frames.feed(data)
+                        except (OSError, ValueError):
+                            data, messages = b"", []
+                        if not data or messages:
+                            selector.unregister(client)
+                            del waiting[client]
+                        if not data:  # The client left before sending its name
+                            self._drop(client, connection_id)
+                        elif messages:
+                            self._start_handler(client, address, handshake=(connection_id, frames, messages))
+                    except Exception as e:
+                        self._logger.error(f"Error finishing the handshake with {address}: {e}")
+                        if waiting.pop(client, None) is not None:
+                            selector.unregister(client)
+                        self._drop(client, connection_id)
+                now = time.monotonic()
+                while self.handshake_timeout is not None and waiting:
+                    client, (address, connection_id, _, deadline) = next(iter(waiting.items()))
+                    if deadline > now:
+                        break
+                    self._logger.info(f"[TIMEOUT] {address} did not send a name in time.")
+                    selector.unregister(client)
+                    del waiting[client]
+                    self._drop(client, connection_id)
+        except Exception as e:
+            # Without this loop the listeners would keep accepting connections that are never served
+            self._logger.critical(f"[SERVER STOPPED] The handshake stage failed: {e}")
+            self._stopped.set()
+        finally:
+            selector.close()
+            for client, (address, connection_id, frames, _) in waiting.items():
+                if self._handing_over:
+                    self._park_session(client, address, None, "default", frames)
+                else:
+                    self._drop(client, connection_id)
+
+    def _park_accepted(self):
+        """Greets and parks connections that were accepted but not yet picked up by the handshake stage."""
+        while True:
+            try:
+                client, address = self._accepted.get_nowait()
+            except queue.Empty:
+                return
+            if self._admit(client, address) is not None:
+                self._park_session(client, address, None, "default", FrameBuffer(self._format))
+
+    def _start_accept_loops(self):
+        """Starts the handshake stage and a thread accepting connections on each listening socket."""
+        loops = [(self._handshake_loop,)] + [
+            (self._accept_loop, listener)
+            for listener in (self.socket, self.unix_socket)
+            if listener is not None
+        ]
+        for args in loops:
+            with self._workers_idle:
+                self._workers += 1
+            thread = threading.Thread(target=self._run_worker, args=args)
+            thread.daemon = True
+            thread.start()
+
+    def _configure_listener(self, listener: socket.socket):
+        """Applies the socket buffer sizes to a listening socket before it starts listening.
+
+        Args:
+            listener (socket.socket): The listening socket.
+        """
+        if self.recv_buffer:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+        if self.send_buffer:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+
+    def _bind_unix(self):
+        """Binds and listens on the Unix domain socket."""
+        if os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)  # Left behind by a previous run
+        self._configure_listener(self.unix_socket)
+        self.unix_socket.bind(self.unix_path)
+        self.unix_socket.listen(self.backlog)
+
+    def _park_session(
+        self, client: socket.socket, address, user_name: str, current_group: str, frames: FrameBuffer
+    ):
+        """Saves the state of a client whose thread stopped for a handover.
+
+        Args:
+            client (socket.socket): The client socket.
+            address (str): The address of the client.
+            user_name (str): The name of the user, or None if they have not sent it yet.
+            current_group (str): The group plain messages are sent to.
+            frames (FrameBuffer): The client's buffer, which may hold part of a message.
+        """
+        with self.lock:
+            memberships = []
+            if user_name is not None:
+                memberships = [
+                    group.name
+                    for group in self.groups.resident()
+                    if group.get_all_users().get(user_name, (None,))[0] is client
+                ]
+            session = {
+                "address": address,
+                "name": user_name,
+                "current_group": current_group,
+                "groups": memberships,
+                "buffer": base64.b64encode(frames.pending()).decode("ascii"),
+            }
+            self._parked.append((client, session))
 
-        # Split the input string into individual JSON objects
-        json_objects = json_string.split("}{")
+    def _resume_sessions(self, sessions: List[Tuple[socket.socket, Dict]]):
+        """Restarts handler threads for connections that were handed over.
 
-        # Handle cases where there are missing curly braces at the beginning or end
-        if len(json_objects) > 1:
-            json_objects[0] = json_objects[0] + "}"
-            json_objects[-1] = "{" + json_objects[-1]
+        Args:
+            sessions (List[Tuple[socket.socket, Dict]]): The client sockets and their saved state.
+        """
+        for client, session in sessions:
+            address = session["address"]
+            if isinstance(address, list):
+                address = tuple(address)  # TCP addresses come back from JSON as lists
+            user_name = session["name"]
+            with self.lock:
+                self.clients[client] = [user_name or "", address]
+                if user_name is not None:
+                    self.directory[user_name] = client
+                    for group_name in session["groups"]:
+                        group = self.groups.get(group_name)
+                        if group and not group.is_user_in_group(user_name):
+                            group.join(user_name, (client, address))
+                self._start_handler(client, address, session)
+
+    def hand_over(self, conn: socket.socket):
+        """Passes the listening sockets and every client connection to the server process on the other end of conn.
+        Once the new process confirms it has them, this server stops without closing any client connections.
+
+        Args:
+            conn (socket.socket): A Unix socket connected to the new server process.
+        """
+        self._logger.info("[HANDOVER] Handing connections to a new server process.")
+        self._handing_over = True
+        self._wakeup_w.send(b"!")
+        with self._workers_idle:
+            if not self._workers_idle.wait_for(
+                lambda: self._workers == 0, timeout=self.handover_timeout
+            ):
+                raise TimeoutError("Client threads did not stop in time")
+        self._park_accepted()
+        if self.pipeline:
+            self.pipeline.drain()  # Nothing may be written to the clients once the new process has them
+        if self.groups.persistent:
+            self.save_snapshot()
+            groups = {}
+        else:
+            groups = {group.name: group.snapshot() for group in self.groups.resident()}
+        listeners = [self.socket] + ([self.unix_socket] if self.unix_socket else [])
+        state = {
+            "unix_path": self.unix_path if self.unix_socket else None,
+            "sessions": [session for _, session in self._parked],
+            "groups": groups,
+            "direct_logs": [
+                [first, second, log.snapshot()]
+                for (first, second), log in self.direct_logs.items()
+            ],
+        }
+        send_state(
+            conn,
+            state,
+            [listener.fileno() for listener in listeners]
+            + [client.fileno() for client, _ in self._parked],
+        )
+        if conn.recv(len(ACK)) != ACK:
+            raise ConnectionError("The new server process did not confirm the handover")
+        self._handed_over = True
+        self._handover_socket.close()
+        os.unlink(self.handover_path)
+        for client, _ in self._parked:
+            client.close()  # Only this process's copy; the connection stays open in the new process
+        self._logger.info(f"[HANDOVER] Handed over {len(self._parked)} connection(s).")
+        self._stopped.set()
 
-        # Iterate through the JSON objects and parse them
-        for obj in json_objects:
+    def _handover_loop(self):
+        """Thread that waits for a new server process to take over this one."""
+        while True:
             try:
-                # Load each JSON object into a dictionary
-                parsed_dict = json.loads(obj)
-                parsed_list.append(parsed_dict)
-            except json.JSONDecodeError:
-                # Handle any JSON decoding errors (invalid JSON)
-                self._logger.info(f"Skipping invalid JSON object: {obj}")
+                conn, _ = self._handover_socket.accept()
+            except OSError:
+                return  # Closed when the server stops
+            with conn:
+                try:
+                    self.hand_over(conn)
+                    return
+                except Exception as e:
+                    self._logger.error(f"Handover failed, resuming service: {e}")
+            self._handing_over = False
+            self._wakeup_r.recv(16)  # Clear the wakeup so threads block again
+            parked, self._parked = self._parked, []
+            self._start_accept_loops()
+            self._resume_sessions(parked)
 
-        return parsed_list
+    def _listen_for_handover(self):
+        """Starts listening on the handover path for a new server process."""
+        if os.path.exists(self.handover_path):
+            os.unlink(self.handover_path)
+        self._handover_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._handover_socket.bind(self.handover_path)
+        self._handover_socket.listen(1)
+        thread = threading.Thread(target=self._handover_loop)
+        thread.daemon = True
+        thread.start()
+
+    def _take_over(self) -> bool:
+        """Takes the listening sockets and client connections of a server already running on the handover path.
+
+        Returns:
+            bool: False if no server is listening on the handover path.
+        """
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.handover_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            conn.close()
+            return False
+        with conn:
+            state, fds = receive_state(conn)
+            self.socket.close()
+            self.socket = socket.socket(fileno=fds.pop(0))
+            self.addr = self.socket.getsockname()[:2]
+            if state["unix_path"]:
+                if self.unix_socket:
+                    self.unix_socket.close()
+                self.unix_path = state["unix_path"]
+                self.unix_socket = socket.socket(fileno=fds.pop(0))
+            elif self.unix_socket:
+                self._bind_unix()
+            for group_name, group_state in state["groups"].items():
+                group = Group.from_snapshot(group_state)
+                group.dirty = True  # Never written by the old process, so write it to this one's store
+                self.groups[group_name] = group
+            for first, second, log_state in state["direct_logs"]:
+                self.direct_logs[(first, second)] = MessageLog.from_snapshot(log_state, "DM")
+            sessions = [
+                (socket.socket(fileno=fd), session)
+                for fd, session in zip(fds, state["sessions"])
+            ]
+            conn.sendall(ACK)
+            conn.recv(1)  # Returns once the old process has let go of everything
+        self._resume_sessions(sessions)
+        self._logger.info(f"[HANDOVER] Took over {len(sessions)} connection(s).")
+        return True
 
     def start(self):
+        snapshot_thread = threading.Thread(target=self._snapshot_loop)
+        snapshot_thread.daemon = True
+        snapshot_thread.start()
+        # Started even without a policy, since set_retention can add one at any time
+        compaction_thread = threading.Thread(target=self._compaction_loop)
+        compaction_thread.daemon = True
+        compaction_thread.start()
+        if self.memory_limits and not self.memory_limits.is_unlimited():
+            memory_thread = threading.Thread(target=self._memory_loop)
+            memory_thread.daemon = True
+            memory_thread.start()
         try:
-            self.socket.setsockopt(
-                socket.SOL_SOCKET, socket.SO_REUSEADDR, 1
-            )  # Allow the socket to be reused
-            self.socket.bind(self.addr)
-            self.socket.listen()
+            if not (self.handover_path and self._take_over()):
+                self.socket.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_REUSEADDR, 1
+                )  # Allow the socket to be reused
+                self._configure_listener(self.socket)
+                self.socket.bind(self.addr)
+                self.socket.listen(self.backlog)
+                if self.unix_socket:
+                    self._bind_unix()
 
             print(f"[LISTENING] Server is listening on {self.addr[0]}:{self.addr[1]}")
-            while True:
-                client, address = self.socket.accept()
-                with self.lock:
-                    self.clients[client] = ["", address]
-                    thread = threading.Thread(
-                        target=self.handle_client, args=(client, address)
-                    )
-                    thread.start()
-                    self._logger.info(f"[ACTIVE CONNECTIONS] {len(self.clients)}")
+            if self.unix_socket:
+                print(f"[LISTENING] Server is listening on {self.unix_path}")
+            self._start_accept_loops()
+            if self.handover_path:
+                self._listen_for_handover()
+            while not self._stopped.wait(1.0):
+                pass
         except KeyboardInterrupt:
             self._logger.info("[SERVER STOPPED] Server stopped by user.")
         except Exception as e:
             self._logger.error(f"Error: {e}")
         finally:
+            self._stopped.set()
             self.socket.close()
+            if self.unix_socket:
+                self.unix_socket.close()
+                if not self._handed_over and os.path.exists(self.unix_path):
+                    os.unlink(self.unix_path)
+            if self._handover_socket and not self._handed_over:
+                self._handover_socket.close()
+                if os.path.exists(self.handover_path):
+                    os.unlink(self.handover_path)
+            if self.pipeline:
+                self.pipeline.shutdown()  # Deliver whatever is still queued before the final snapshot
+            if not self._handed_over:  # Otherwise the groups belong to the new process now
+                self.save_snapshot()
+            if self._recorder:
+                self._recorder.close()
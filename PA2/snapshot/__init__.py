@@ -0,0 +1 @@
+from snapshot.runtime import *
\ No newline at end of file
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from typing import Dict, Optional
+
+
+class SnapshotStore:
+    """
+    This class will handle persisting groups and their message logs to disk.
+
+    Every group is written to its own zlib compressed JSON file so that a single group can be
+    loaded without reading any of the others. An index file maps stored group names to their
+    original names and is only read when the full list of groups is requested. Messages paged
+    out of a group's log are written to page files next to the group's file.
+    """
+
+    VERSION = 1
+    _SUFFIX = ".snap"
+    _PAGE_SUFFIX = ".page"
+    _INDEX = "index.snap"
+
+    def __init__(self, directory: str):
+        """
+        This function will initialize the store, creating the snapshot directory if needed.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._index: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _path(self, group_name: str) -> str:
+        """
+        This function will return the file path used for a group. Names come straight from clients, so the
+        file is named by a digest of the name, which keeps it short enough for any file system.
+        """
+        digest = hashlib.sha256(group_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + self._SUFFIX)
+
+    def _page_path(self, group_name: str, first_id: int) -> str:
+        """
+        This function will return the file path used for the page of a group's messages starting at first_id.
+        """
+        return self._path(group_name)[: -len(self._SUFFIX)] + f".{first_id}{self._PAGE_SUFFIX}"
+
+    def _write(self, path: str, data: object):
+        """
+        This function will atomically write compressed JSON to a path.
+        """
+        payload = zlib.compress(
+            json.dumps(data, separators=(",", ":")).encode("utf-8")
+        )
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(payload)
+        os.replace(temp_path, path)
+
+    def _read(self, path: str) -> Optional[object]:
+        """
+        This function will read compressed JSON from a path. Returns None if the file is missing.
+        """
+        try:
+            with open(path, "rb") as file:
+                payload = file.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+    def exists(self, group_name: str) -> bool:
+        """
+        This function will return whether or not a snapshot exists for a group.
+        """
+        return os.path.exists(self._path(group_name))
+
+    def load(self, group_name: str) -> Optional[dict]:
+        """
+        This function will return the stored state of a group, or None if it was never saved.
+        """
+        state = self._read(self._path(group_name))
+        if state is None:
+            return None
+        if state.get("version") != self.VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version {state.get('version')} for {group_name}"
+            )
+        return state
+
+    def save(self, group_name: str, state: dict):
+        """
+        This function will write the state of a group to disk.
+        """
+        state = dict(state, version=self.VERSION)
+        self._write(self._path(group_name), state)
+
+    def load_page(self, group_name: str, first_id: int) -> Optional[dict]:
+        """
+        This function will return a page of a group's messages, or None if it was deleted.
+        """
+        state = self._read(self._page_path(group_name, first_id))
+        if state is not None and state.get("version") != self.VERSION:
+            raise ValueError(
+                f"Unsupported page version {state.get('version')} for {group_name}"
+            )
+        return state
+
+    def save_page(self, group_name: str, first_id: int, state: dict):
+        """
+        This function will write a page of a group's messages to disk.
+        """
+        self._write(self._page_path(group_name, first_id), dict(state, version=self.VERSION))
+
+    def delete_page(self, group_name: str, first_id: int):
+        """
+        This function will delete a page of a group's messages once they are no longer kept.
+        """
+        try:
+            os.remove(self._page_path(group_name, first_id))
+        except FileNotFoundError:
+            pass
+
+    def load_index(self) -> Dict[str, str]:
+        """
+        This function will return a copy of the {stored name: original name} index.
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = self._read(os.path.join(self.directory, self._INDEX)) or {}
+            return dict(self._index)
+
+    def save_index(self, names: Dict[str, str]):
+        """
+        This function will merge names into the index and write it to disk if anything changed.
+        """
+        current = self.load_index()
+        merged = dict(current, **names)
+        if merged == current:
+            return
+        with self._lock:
+            self._index = merged
+            self._write(os.path.join(self.directory, self._INDEX), merged)
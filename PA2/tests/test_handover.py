@@ -0,0 +1,167 @@
+"""Tests a zero downtime restart between two server processes started with the same --handover path.
+
+Run from the PA2 directory:
+    python -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from handover import fd_passing_supported
+from protocol import FrameBuffer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+def frame(name: str, message: str) -> bytes:
+    return json.dumps({"name": name, "message": message, "subject": ""}).encode("utf-8")
+
+
+class ChatClient:
+    """A minimal client that reads the server's frames without prompting for input."""
+
+    def __init__(self, sock: socket.socket, name: str = None):
+        self.socket = sock
+        self.socket.settimeout(10.0)
+        self.name = name
+        self.frames = FrameBuffer()
+        self.pending = []
+        if name:
+            self.socket.sendall(frame(name, "has connected."))
+
+    def send(self, message: str):
+        self.socket.sendall(frame(self.name, message))
+
+    def wait_for(self, predicate) -> dict:
+        """Reads until a message matching predicate arrives and returns it."""
+        while True:
+            while self.pending:
+                message = self.pending.pop(0)
+                if predicate(message):
+                    return message
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            self.pending = self.frames.feed(data)
+
+    def wait_for_text(self, text: str) -> dict:
+        return self.wait_for(lambda message: message.get("message", "").startswith(text))
+
+
+@unittest.skipUnless(fd_passing_supported(), "Sockets cannot be passed between processes on this platform")
+class HandoverTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.port = free_port()
+        self.handover_path = os.path.join(self.directory, "handover.sock")
+        self.unix_path = os.path.join(self.directory, "server.sock")
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.socket.close()
+
+    def start_server(self) -> subprocess.Popen:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "launch_server.py"),
+                "--port", str(self.port),
+                "--unix", self.unix_path,
+                "--handover", self.handover_path,
+                "--snapshot-dir", "",
+            ],
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(self.stop_server, server)
+        return server
+
+    @staticmethod
+    def stop_server(server: subprocess.Popen):
+        if server.poll() is None:
+            server.terminate()
+        server.wait()
+
+    def wait_until_listening(self):
+        deadline = time.monotonic() + 10.0
+        while time.monotonic() < deadline:
+            if os.path.exists(self.handover_path):
+                try:
+                    socket.create_connection(("localhost", self.port), timeout=1.0).close()
+                    return
+                except OSError:
+                    pass
+            time.sleep(0.05)
+        self.fail("Server did not start listening")
+
+    def connect(self, name: str = None, unix: bool = False) -> ChatClient:
+        if unix:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.unix_path)
+        else:
+            sock = socket.create_connection(("localhost", self.port))
+        client = ChatClient(sock, name)
+        self.clients.append(client)
+        return client
+
+    def test_sessions_survive_handover(self):
+        old_server = self.start_server()
+        self.wait_until_listening()
+
+        alice = self.connect("alice")
+        bob = self.connect("bob", unix=True)
+        for client in (alice, bob):
+            client.send("!join 'room'")
+            client.wait_for_text("Members:")
+        alice.send("!switch 'room'")
+        alice.wait_for_text("New Server: room")
+        alice.send("before the restart")
+        bob.wait_for_text("before the restart")
+
+        # Frames cut off mid-way, from a registered client and from one that has not sent its name yet
+        split = frame("alice", "split across the restart")
+        alice.socket.sendall(split[:20])
+        late = self.connect()
+        late.wait_for(lambda message: True)  # The greeting, so the connection has been admitted
+        greeting = frame("carol", "has connected.")
+        late.socket.sendall(greeting[:12])
+        time.sleep(0.2)
+
+        self.start_server()
+        self.assertEqual(old_server.wait(timeout=30), 0)
+
+        alice.socket.sendall(split[20:])
+        self.assertEqual(bob.wait_for_text("split across the restart")["name"], "alice")
+
+        late.socket.sendall(greeting[12:])
+        late.name = "carol"
+        late.send("!dm 'bob' hello from carol")
+        self.assertEqual(bob.wait_for_text("hello from carol")["name"], "carol")
+
+        bob.send("!get_members 'room'")
+        members = bob.wait_for_text("Members:")["message"]
+        self.assertIn("'alice'", members)
+        self.assertIn("'bob'", members)
+
+        # The listeners were passed on too
+        newcomer = self.connect("dave")
+        newcomer.send("!get_groups")
+        newcomer.wait_for_text("Groups:")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+"""Tests for MessageLog retention and RetentionPolicy.
+
+Run from the PA2 directory:
+    python -m unittest discover tests
+"""
+import sys
+import tempfile
+import threading
+import unittest
+from message_log import MessageLog, RetentionPolicy
+from snapshot import SnapshotStore
+
+
+def make_log(count: int, timestamp: int = None) -> MessageLog:
+    log = MessageLog("group")
+    for index in range(count):
+        log.add_message({"name": "alice", "message": f"message {index}", "subject": ""})
+    if timestamp is not None:
+        for record in log.messages:
+            record.timestamp = timestamp
+    return log
+
+
+def record_bytes(log: MessageLog) -> int:
+    return sum(record.size() for record in log.messages)
+
+
+class CompactTests(unittest.TestCase):
+    def test_max_messages_keeps_newest(self):
+        log = make_log(10)
+        evicted, reclaimed = log.compact(RetentionPolicy(max_messages=4))
+        self.assertEqual(evicted, 6)
+        self.assertEqual([record.id for record in log.messages], [7, 8, 9, 10])
+        self.assertEqual(log.total_bytes, record_bytes(log))
+        self.assertGreater(reclaimed, 0)
+
+    def test_under_limits_is_untouched(self):
+        log = make_log(3)
+        self.assertEqual(log.compact(RetentionPolicy(max_messages=5, max_bytes=10**6)), (0, 0))
+        self.assertEqual(len(log.messages), 3)
+
+    def test_unlimited_policy_keeps_everything(self):
+        log = make_log(5)
+        self.assertEqual(log.compact(RetentionPolicy()), (0, 0))
+        self.assertEqual(len(log.messages), 5)
+
+    def test_max_age(self):
+        log = make_log(4, timestamp=1000)
+        log.add_message({"name": "alice", "message": "recent", "subject": ""})
+        log.messages[-1].timestamp = 2000
+        evicted, _ = log.compact(RetentionPolicy(max_age=500), now=2100)
+        self.assertEqual(evicted, 4)
+        self.assertEqual([record.message for record in log.messages], ["recent"])
+
+    def test_max_bytes(self):
+        log = make_log(10)
+        limit = record_bytes(log) // 2
+        log.compact(RetentionPolicy(max_bytes=limit))
+        self.assertLessEqual(log.total_bytes, limit)
+        self.assertEqual(log.total_bytes, record_bytes(log))
+        self.assertEqual(log.messages[-1].id, 10)
+
+    def test_ids_stay_stable_and_expired_ids_are_reported(self):
+        log = make_log(10)
+        log.compact(RetentionPolicy(max_messages=3))
+        self.assertEqual(log.get_message_by_id(9)["message"], "message 8")
+        expired = log.get_message_by_id(2)
+        self.assertTrue(expired["expired"])
+        self.assertEqual(expired["id"], 2)
+        self.assertEqual(log.get_message_by_id(11), log.blank_message)
+        log.add_message({"name": "alice", "message": "next", "subject": ""})
+        self.assertEqual(log.messages[-1].id, 11)
+
+    def test_snapshot_round_trip_keeps_first_id(self):
+        log = make_log(6)
+        log.compact(RetentionPolicy(max_messages=2))
+        restored = MessageLog.from_snapshot(log.snapshot(), "group")
+        self.assertEqual(restored.first_id, 5)
+        self.assertEqual([record.id for record in restored.messages], [5, 6])
+        self.assertEqual(restored.total_bytes, record_bytes(restored))
+
+    def test_concurrent_compactions_do_not_overshoot(self):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads often enough for unsynchronized compactions to interleave
+        self.addCleanup(sys.setswitchinterval, interval)
+        for _ in range(20):
+            log = make_log(2000)
+            barrier = threading.Barrier(4)
+
+            def compact():
+                barrier.wait()
+                log.compact(RetentionPolicy(max_messages=1200))
+
+            threads = [threading.Thread(target=compact) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(log.messages), 1200)
+            self.assertEqual(log.first_id, 801)
+            self.assertEqual(log.total_bytes, record_bytes(log))
+
+    def test_compaction_alongside_appends(self):
+        log = make_log(0)
+        stop = threading.Event()
+
+        def append():
+            while not stop.is_set():
+                log.add_message({"name": "alice", "message": "x", "subject": ""})
+
+        writer = threading.Thread(target=append)
+        writer.start()
+        try:
+            for _ in range(200):
+                log.compact(RetentionPolicy(max_messages=50))
+        finally:
+            stop.set()
+            writer.join()
+        self.assertEqual(log.total_bytes, record_bytes(log))
+        ids = [record.id for record in log.messages]
+        self.assertEqual(ids, list(range(log.first_id, log.first_id + len(ids))))
+
+
+class PageOutTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SnapshotStore(directory.name)
+        self.log = make_log(10)
+        self.log.pager = self.store
+
+    def test_paged_messages_are_read_back(self):
+        before = self.log.total_bytes
+        paged, reclaimed = self.log.page_out(3)
+        self.assertEqual(paged, 7)
+        self.assertEqual([record.id for record in self.log.messages], [8, 9, 10])
+        self.assertEqual(self.log.total_bytes, before - reclaimed)
+        self.assertEqual(self.log.total_bytes, record_bytes(self.log))
+        self.assertEqual(self.log.get_message_by_id(2)["message"], "message 1")
+        self.assertEqual(self.log.get_message_by_id(9)["message"], "message 8")
+        self.log.add_message({"name": "alice", "message": "next", "subject": ""})
+        self.assertEqual(self.log.messages[-1].id, 11)
+
+    def test_compaction_counts_paged_messages(self):
+        self.log.page_out(3)
+        self.assertEqual(self.log.compact(RetentionPolicy(max_messages=5))[0], 5)
+        self.assertEqual(self.log.first_id, 6)
+        self.assertTrue(self.log.get_message_by_id(5)["expired"])
+        self.assertEqual(self.log.get_message_by_id(6)["message"], "message 5")
+        self.assertEqual(len(self.log.messages), 3)
+        evicted, reclaimed = self.log.compact(RetentionPolicy(max_messages=2))
+        self.assertEqual(evicted, 3)
+        self.assertGreater(reclaimed, 0)
+        self.assertEqual(self.log.pages, [])
+        self.assertIsNone(self.store.load_page("group", 1))
+        self.assertEqual([record.id for record in self.log.messages], [9, 10])
+
+    def test_max_age_and_max_bytes_drop_whole_pages(self):
+        for record in self.log.messages:
+            record.timestamp = 1000 + record.id
+        self.log.page_out(5)  # Page of ids 1 to 5, newest timestamp 1005
+        self.assertEqual(self.log.compact(RetentionPolicy(max_age=100), now=1104)[0], 0)
+        self.assertEqual(self.log.compact(RetentionPolicy(max_age=100), now=1108)[0], 7)
+        self.assertEqual(self.log.first_id, 8)
+        log = make_log(10)
+        log.pager = self.store
+        log.page_out(5)
+        log.compact(RetentionPolicy(max_bytes=log.total_bytes))
+        self.assertEqual((log.first_id, log.pages, len(log.messages)), (6, [], 5))
+
+    def test_snapshot_round_trip_keeps_pages(self):
+        self.log.page_out(4)
+        restored = MessageLog.from_snapshot(self.log.snapshot(), "group", self.store)
+        self.assertEqual([record.id for record in restored.messages], [7, 8, 9, 10])
+        self.assertEqual(restored.get_message_by_id(3)["message"], "message 2")
+        restored.add_message({"name": "alice", "message": "next", "subject": ""})
+        self.assertEqual(restored.messages[-1].id, 11)
+
+
+class RetentionPolicyParseTests(unittest.TestCase):
+    def test_all_fields(self):
+        policy = RetentionPolicy.parse("100,3600,2048")
+        self.assertEqual((policy.max_messages, policy.max_age, policy.max_bytes), (100, 3600.0, 2048))
+
+    def test_empty_fields_are_unlimited(self):
+        policy = RetentionPolicy.parse("5,,100")
+        self.assertEqual((policy.max_messages, policy.max_age, policy.max_bytes), (5, None, 100))
+        self.assertTrue(RetentionPolicy.parse("").is_unlimited())
+        self.assertTrue(RetentionPolicy.parse(",,").is_unlimited())
+
+    def test_missing_trailing_fields(self):
+        policy = RetentionPolicy.parse(" 7 ")
+        self.assertEqual((policy.max_messages, policy.max_age, policy.max_bytes), (7, None, None))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RetentionPolicy.parse("1,2,3,4")
+        with self.assertRaises(ValueError):
+            RetentionPolicy.parse("many")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Tests for MessagePipeline ordering and its fallbacks.
+
+Stage functions run in worker processes, so they are defined at the top level of this module.
+
+Run from the PA2 directory:
+    python -m unittest discover tests
+"""
+import os
+import random
+import threading
+import time
+import unittest
+from pipeline import MessagePipeline, PipelineStage
+
+
+def jitter(message):
+    time.sleep(random.random() * 0.005)
+    return message
+
+
+def stall(message):
+    time.sleep(0.5)
+    return message
+
+
+def crash(message):
+    if message["message"] == "crash":
+        os._exit(1)
+    message["message"] = message["message"].upper()
+    return message
+
+
+def replace_body(message):
+    message["message"] = "fallback"
+    return message
+
+
+class Collector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = {}
+
+    def callback(self, key):
+        def deliver(message):
+            with self.lock:
+                self.received.setdefault(key, []).append(message["message"])
+        return deliver
+
+
+class MessagePipelineTests(unittest.TestCase):
+    def make_pipeline(self, *stages, **kwargs) -> MessagePipeline:
+        pipeline = MessagePipeline(list(stages), **kwargs)
+        self.addCleanup(pipeline.shutdown)
+        return pipeline
+
+    def test_messages_of_a_group_stay_in_order(self):
+        pipeline = self.make_pipeline(PipelineStage("jitter", jitter), workers=4, dispatchers=4)
+        collector = Collector()
+        groups = [f"group{index}" for index in range(6)]
+        for index in range(30):
+            for group in groups:
+                pipeline.submit(group, {"name": "alice", "message": str(index)}, collector.callback(group))
+        pipeline.drain()
+        for group in groups:
+            self.assertEqual(collector.received[group], [str(index) for index in range(30)])
+
+    def test_timeout_runs_fallback(self):
+        stage = PipelineStage("stall", stall, timeout=0.05, fallback=replace_body)
+        pipeline = self.make_pipeline(stage, workers=1, dispatchers=1)
+        collector = Collector()
+        pipeline.submit("group", {"name": "alice", "message": "slow"}, collector.callback("group"))
+        pipeline.drain()
+        self.assertEqual(collector.received["group"], ["fallback"])
+        self.assertEqual(pipeline.get_stats()["stall"]["timeouts"], 1)
+
+    def test_lost_worker_runs_fallback_and_pool_recovers(self):
+        stage = PipelineStage("crash", crash, timeout=5.0, fallback=replace_body)
+        pipeline = self.make_pipeline(stage, workers=2, dispatchers=1)
+        collector = Collector()
+        for body in ("before", "crash", "after"):
+            pipeline.submit("group", {"name": "alice", "message": body}, collector.callback("group"))
+        pipeline.drain()
+        self.assertEqual(collector.received["group"], ["BEFORE", "fallback", "AFTER"])
+        stats = pipeline.get_stats()["crash"]
+        self.assertEqual((stats["count"], stats["errors"]), (3, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Tests for FrameBuffer, the framing used by both the server and the client.
+
+Run from the PA2 directory:
+    python -m unittest discover tests
+"""
+import json
+import unittest
+from protocol import FrameBuffer
+
+
+def frame(message: str, **fields) -> bytes:
+    message = dict({"name": "alice", "message": message, "subject": ""}, **fields)
+    return json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+
+class FrameBufferTests(unittest.TestCase):
+    def test_single_frame(self):
+        frames = FrameBuffer()
+        self.assertEqual(frames.feed(frame("hello")), [json.loads(frame("hello"))])
+        self.assertEqual(frames.pending(), b"")
+
+    def test_several_frames_in_one_read(self):
+        frames = FrameBuffer()
+        messages = frames.feed(frame("one") + frame("two") + frame("three"))
+        self.assertEqual([message["message"] for message in messages], ["one", "two", "three"])
+
+    def test_frame_split_across_reads(self):
+        frames = FrameBuffer()
+        data = frame("split in two")
+        self.assertEqual(frames.feed(data[:10]), [])
+        self.assertEqual(frames.pending(), data[:10])
+        self.assertEqual(frames.feed(data[10:])[0]["message"], "split in two")
+        self.assertEqual(frames.pending(), b"")
+
+    def test_frame_split_one_byte_at_a_time(self):
+        frames = FrameBuffer()
+        data = frame("byte by byte") + frame("second")
+        messages = []
+        for index in range(len(data)):
+            messages.extend(frames.feed(data[index : index + 1]))
+        self.assertEqual([message["message"] for message in messages], ["byte by byte", "second"])
+
+    def test_multibyte_character_split_across_reads(self):
+        frames = FrameBuffer()
+        data = frame("café ☃", subject="ü")
+        cut = data.index("☃".encode("utf-8")) + 1  # Inside the three byte character
+        self.assertEqual(frames.feed(data[:cut]), [])
+        message = frames.feed(data[cut:])[0]
+        self.assertEqual(message["message"], "café ☃")
+
+    def test_escape_split_across_reads(self):
+        frames = FrameBuffer()
+        data = json.dumps({"name": "alice", "message": "☃"}, ensure_ascii=True).encode("ascii")
+        cut = data.index(b"\\u") + 3
+        self.assertEqual(frames.feed(data[:cut]), [])
+        self.assertEqual(frames.feed(data[cut:])[0]["message"], "☃")
+
+    def test_complete_frame_followed_by_partial_frame(self):
+        frames = FrameBuffer()
+        second = frame("second")
+        messages = frames.feed(frame("first") + second[:5])
+        self.assertEqual([message["message"] for message in messages], ["first"])
+        self.assertEqual(frames.pending(), second[:5])
+        self.assertEqual(frames.feed(second[5:])[0]["message"], "second")
+
+    def test_invalid_frame_is_skipped(self):
+        frames = FrameBuffer()
+        messages = frames.feed(b"{not json}" + frame("after"))
+        self.assertEqual([message["message"] for message in messages], ["after"])
+
+    def test_garbage_between_frames_is_skipped(self):
+        frames = FrameBuffer()
+        messages = frames.feed(frame("one") + b"\n junk \xff" + frame("two"))
+        self.assertEqual([message["message"] for message in messages], ["one", "two"])
+
+    def test_non_object_json_is_ignored(self):
+        frames = FrameBuffer()
+        self.assertEqual(frames.feed(b'["a", "list"] 42'), [])
+        self.assertEqual(frames.pending(), b"")
+
+    def test_braces_inside_strings(self):
+        frames = FrameBuffer()
+        data = frame('} {"name": "bob"} \\" {', subject="{")
+        messages = []
+        for index in range(len(data)):
+            messages.extend(frames.feed(data[index : index + 1]))
+        self.assertEqual([message["message"] for message in messages], ['} {"name": "bob"} \\" {'])
+
+    def test_large_frame_in_small_reads(self):
+        frames = FrameBuffer()
+        text = "{x} " * (FrameBuffer.MAX_PENDING // 8)
+        data = frame(text)
+        messages = []
+        for index in range(0, len(data), 1024):
+            messages.extend(frames.feed(data[index : index + 1024]))
+        self.assertEqual([message["message"] for message in messages], [text])
+        self.assertEqual(frames.pending(), b"")
+
+    def test_unbalanced_frame_is_skipped_once_large(self):
+        frames = FrameBuffer()
+        messages = frames.feed(b'{"message": "never closed", ' + frame("x" * FrameBuffer._MIN_CHECK))
+        self.assertEqual([message["message"] for message in messages], ["x" * FrameBuffer._MIN_CHECK])
+
+    def test_oversized_unterminated_frame_is_dropped(self):
+        frames = FrameBuffer()
+        frames.feed(b'{"message": "' + b"x" * FrameBuffer.MAX_PENDING)
+        self.assertEqual(frames.pending(), b"")
+        self.assertEqual(frames.feed(frame("next"))[0]["message"], "next")
+
+
+if __name__ == "__main__":
+    unittest.main()